@@ -0,0 +1,108 @@
+# backend/admission.py
+
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+# =============================================================================
+# ADMISSION CONTROL
+# =============================================================================
+
+class AdmissionRejected(Exception):
+    """Raised when a request can't be admitted. Carries the HTTP status and Retry-After seconds."""
+
+    def __init__(self, status, reason, retry_after):
+        super().__init__(reason)
+        self.status = status
+        self.reason = reason
+        self.retry_after = retry_after
+
+class AdmissionController:
+    """
+    Bounds how many requests of one kind run at once.
+
+    Up to max_concurrent requests run, at most max_per_client of them (running or
+    queued) per client. Further requests wait in a queue of at most max_queue
+    entries for up to queue_timeout seconds. Requests that can't be queued are
+    rejected straight away: 429 when the client is over its own limit, 503 when
+    the server is full.
+    """
+
+    def __init__(self, name, max_concurrent, max_per_client, max_queue, queue_timeout, retry_after):
+        self.name = name
+        self.max_concurrent = max_concurrent
+        self.max_per_client = max_per_client
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.retry_after = retry_after
+
+        self._condition = threading.Condition()
+        self._active = 0
+        self._waiting = 0
+        self._per_client = defaultdict(int)
+        self._admitted_total = 0
+        self._rejected_total = 0
+
+    @contextmanager
+    def admit(self, client_id):
+        """Hold a slot for the duration of the with-block, or raise AdmissionRejected."""
+        self._acquire(client_id)
+        try:
+            yield
+        finally:
+            self._release(client_id)
+
+    def _acquire(self, client_id):
+        with self._condition:
+            if self._per_client[client_id] >= self.max_per_client:
+                self._reject(client_id)
+                raise AdmissionRejected(429, f"Too many concurrent {self.name} requests from this client.", self.retry_after)
+
+            if self._active >= self.max_concurrent and self._waiting >= self.max_queue:
+                self._reject(client_id)
+                raise AdmissionRejected(503, f"Server is busy with {self.name} requests, please retry later.", self.retry_after)
+
+            self._per_client[client_id] += 1
+            if self._active >= self.max_concurrent:
+                self._waiting += 1
+                deadline = time.monotonic() + self.queue_timeout
+                try:
+                    while self._active >= self.max_concurrent:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            self._per_client[client_id] -= 1
+                            self._reject(client_id)
+                            raise AdmissionRejected(503, f"Timed out waiting for a free {self.name} slot.", self.retry_after)
+                        self._condition.wait(remaining)
+                finally:
+                    self._waiting -= 1
+
+            self._active += 1
+            self._admitted_total += 1
+
+    def _release(self, client_id):
+        with self._condition:
+            self._active -= 1
+            self._per_client[client_id] -= 1
+            if self._per_client[client_id] <= 0:
+                del self._per_client[client_id]
+            self._condition.notify()
+
+    def _reject(self, client_id):
+        self._rejected_total += 1
+        if self._per_client.get(client_id) == 0:
+            del self._per_client[client_id]
+
+    def stats(self):
+        """Current load, for the metrics endpoint."""
+        with self._condition:
+            return {
+                'active': self._active,
+                'queue_depth': self._waiting,
+                'max_concurrent': self.max_concurrent,
+                'max_queue': self.max_queue,
+                'clients': len(self._per_client),
+                'admitted_total': self._admitted_total,
+                'rejected_total': self._rejected_total,
+            }
@@ -1,28 +1,206 @@
 # backend/app.py
 
-from flask import Flask, request, send_from_directory, jsonify, send_file
+from flask import Flask, request, send_from_directory, jsonify, send_file, make_response, Response
 import os
-import shutil
+import io
+import hmac
+import json
+import logging
 import zipfile
+from functools import wraps
 from werkzeug.utils import secure_filename
 # Import the new preview function
 from pixelate_and_convert import (
-    slice_video_to_frames, 
     process_image_and_generate_c_code, 
     process_directory_and_generate_c_code,
-    generate_live_preview
+    process_video_and_generate_c_code,
+    load_footprint_report,
+    load_animation_header,
+    parse_setting_value,
+    validate_settings,
+    SETTING_TYPES,
+    SHARED_DECODE_SETTINGS,
+    Pixelator,
+    C_ENCODING,
+    C_IDENTIFIER_PATTERN,
+    FlashBudgetError,
 )
+from workspace import Workspace
+from admission import AdmissionController, AdmissionRejected
+from artifact_store import get_artifact_store
+from profiling import get_profile_store
+from frame_bundle import bundle_registered_animations
 
 # --- Flask App Setup ---
 # Use app.root_path to make paths relative to the backend folder
+# Uploads and intermediate frames live in a per-request Workspace (tmpfs-backed when available)
 app = Flask(__name__, static_folder=None) 
-UPLOAD_FOLDER = os.path.join(app.root_path, "uploads")
-app.config["UPLOAD_FOLDER"] = UPLOAD_FOLDER
-os.makedirs(UPLOAD_FOLDER, exist_ok=True)
+
+# Pipeline progress is logged at INFO and per-frame details at DEBUG; keep request handling quiet by default.
+logging.basicConfig(level=os.environ.get("PIXELATOR_LOG_LEVEL", "WARNING").upper(), format="%(levelname)s %(name)s: %(message)s")
+logger = logging.getLogger(__name__)
+
+# --- Admission Control Settings ---
+# Heavy /upload pipelines and cheap /api/preview renders get separate limits.
+app.config["UPLOAD_MAX_CONCURRENT"] = int(os.environ.get("PIXELATOR_UPLOAD_MAX_CONCURRENT", 2))
+app.config["UPLOAD_MAX_PER_CLIENT"] = int(os.environ.get("PIXELATOR_UPLOAD_MAX_PER_CLIENT", 1))
+app.config["UPLOAD_MAX_QUEUE"] = int(os.environ.get("PIXELATOR_UPLOAD_MAX_QUEUE", 4))
+app.config["UPLOAD_QUEUE_TIMEOUT"] = float(os.environ.get("PIXELATOR_UPLOAD_QUEUE_TIMEOUT", 30))
+app.config["UPLOAD_MAX_BYTES"] = int(os.environ.get("PIXELATOR_UPLOAD_MAX_BYTES", 200 * 1024 * 1024))
+app.config["PREVIEW_MAX_CONCURRENT"] = int(os.environ.get("PIXELATOR_PREVIEW_MAX_CONCURRENT", 8))
+app.config["PREVIEW_MAX_PER_CLIENT"] = int(os.environ.get("PIXELATOR_PREVIEW_MAX_PER_CLIENT", 2))
+app.config["PREVIEW_MAX_QUEUE"] = int(os.environ.get("PIXELATOR_PREVIEW_MAX_QUEUE", 16))
+app.config["PREVIEW_QUEUE_TIMEOUT"] = float(os.environ.get("PIXELATOR_PREVIEW_QUEUE_TIMEOUT", 2))
+app.config["PREVIEW_MAX_BYTES"] = int(os.environ.get("PIXELATOR_PREVIEW_MAX_BYTES", 16 * 1024))
+# Hard cap for bodies without a Content-Length (chunked uploads); Werkzeug stops reading past it.
+# admission_controlled lowers it per route to that route's own limit.
+app.config["MAX_CONTENT_LENGTH"] = app.config["UPLOAD_MAX_BYTES"]
+# Admin endpoints need this token in the X-Admin-Token header; without one they are disabled.
+# PIXELATOR_ADMIN_ALLOW_LOCAL=1 opts in to trusting local requests instead. Never set it behind a
+# reverse proxy on the same host, since every proxied request comes from localhost.
+app.config["ADMIN_TOKEN"] = os.environ.get("PIXELATOR_ADMIN_TOKEN")
+app.config["ADMIN_ALLOW_LOCAL"] = os.environ.get("PIXELATOR_ADMIN_ALLOW_LOCAL") == "1"
+
+upload_admission = AdmissionController(
+    "upload",
+    max_concurrent=app.config["UPLOAD_MAX_CONCURRENT"],
+    max_per_client=app.config["UPLOAD_MAX_PER_CLIENT"],
+    max_queue=app.config["UPLOAD_MAX_QUEUE"],
+    queue_timeout=app.config["UPLOAD_QUEUE_TIMEOUT"],
+    retry_after=10,
+)
+preview_admission = AdmissionController(
+    "preview",
+    max_concurrent=app.config["PREVIEW_MAX_CONCURRENT"],
+    max_per_client=app.config["PREVIEW_MAX_PER_CLIENT"],
+    max_queue=app.config["PREVIEW_MAX_QUEUE"],
+    queue_timeout=app.config["PREVIEW_QUEUE_TIMEOUT"],
+    retry_after=1,
+)
+
+def admission_controlled(controller, max_bytes_setting):
+    """
+    Rejects oversized bodies by their Content-Length before anything is read,
+    then runs the route inside one of the controller's slots. Bodies without a
+    Content-Length (chunked uploads) are cut off at the same limit while they are read.
+    """
+    def decorator(route):
+        @wraps(route)
+        def wrapper(*args, **kwargs):
+            max_bytes = app.config[max_bytes_setting]
+            if request.content_length is not None and request.content_length > max_bytes:
+                return jsonify({'error': f"Request body too large (limit is {max_bytes} bytes)."}), 413
+            request.max_content_length = max_bytes
+
+            try:
+                with controller.admit(request.remote_addr):
+                    return route(*args, **kwargs)
+            except AdmissionRejected as e:
+                response = jsonify({'error': e.reason})
+                response.status_code = e.status
+                response.headers['Retry-After'] = str(e.retry_after)
+                return response
+        return wrapper
+    return decorator
+
+def parse_variants(raw_variants, settings):
+    """
+    Parses the optional 'variants' form field: a JSON list of setting overrides,
+    each checked on top of the request's settings.
+    Returns None when no batch was requested. Raises ValueError on bad input.
+    """
+    if not raw_variants:
+        return None
+
+    variants = json.loads(raw_variants)
+    if not isinstance(variants, list) or not all(isinstance(v, dict) for v in variants):
+        raise ValueError("'variants' must be a JSON list of objects")
+
+    parsed_variants = []
+    for variant in variants:
+        parsed = {}
+        for key, value in variant.items():
+            if key == 'struct_name':
+                parsed[key] = secure_filename(str(value))
+                if parsed[key] and not C_IDENTIFIER_PATTERN.match(parsed[key]):
+                    raise ValueError(f"'{value}' is not a valid C identifier")
+                continue
+            # Decode settings are shared by all variants of one upload
+            if key not in SETTING_TYPES or key in SHARED_DECODE_SETTINGS:
+                raise ValueError(f"Unsupported variant setting '{key}'")
+            try:
+                parsed[key] = parse_setting_value(key, value)
+            except (TypeError, OverflowError):
+                raise ValueError(f"Invalid value for '{key}': {value!r}")
+        validate_settings(dict(settings, **{k: v for k, v in parsed.items() if k != 'struct_name'}))
+        parsed_variants.append(parsed)
+    return parsed_variants
+
+def variants_response(c_code_by_variant, struct_name, as_zip, footprints, headers):
+    """Returns batch results as JSON or as a zip with one .c file (and .h for non-default grids) per variant."""
+    if as_zip:
+        zip_io = io.BytesIO()
+        with zipfile.ZipFile(zip_io, 'w', zipfile.ZIP_DEFLATED) as zip_file:
+            for variant_name, c_code in c_code_by_variant.items():
+                zip_file.writestr(f"{variant_name}.c", c_code)
+                if headers.get(variant_name):
+                    zip_file.writestr(f"{variant_name}.h", headers[variant_name])
+        zip_io.seek(0)
+        return send_file(zip_io, mimetype='application/zip', as_attachment=True,
+                         download_name=f"{struct_name}_variants.zip")
+
+    return jsonify({
+        'struct_name': struct_name,
+        'variants': [
+            {'struct_name': variant_name, 'c_code': c_code, 'header': headers.get(variant_name),
+             'footprint': footprints.get(variant_name)}
+            for variant_name, c_code in c_code_by_variant.items()
+        ]
+    })
+
+def is_admin_request():
+    """True for requests carrying the admin token, or local requests when explicitly allowed."""
+    admin_token = app.config["ADMIN_TOKEN"]
+    if admin_token:
+        return hmac.compare_digest(request.headers.get('X-Admin-Token', ''), admin_token)
+    return app.config["ADMIN_ALLOW_LOCAL"] and request.remote_addr in ('127.0.0.1', '::1')
+
+def admin_required(route):
+    """Restricts a route to admin requests."""
+    @wraps(route)
+    def wrapper(*args, **kwargs):
+        if not is_admin_request():
+            return jsonify({'error': 'Admin authorization required.'}), 403
+        return route(*args, **kwargs)
+    return wrapper
+
+def profiled(label):
+    """
+    Runs the route under the profiler when an admin asks for it with an
+    'X-Profile: 1' header or '?profile=1', or when the request is picked by
+    background sampling. The profile id is returned in the X-Profile-Id header.
+    """
+    def decorator(route):
+        @wraps(route)
+        def wrapper(*args, **kwargs):
+            store = get_profile_store()
+            requested = request.headers.get('X-Profile') == '1' or request.args.get('profile') == '1'
+            if not ((requested and is_admin_request()) or store.should_sample()):
+                return route(*args, **kwargs)
+
+            result, profile_id = store.run(label, route, *args, **kwargs)
+            response = make_response(result)
+            if profile_id:
+                response.headers['X-Profile-Id'] = profile_id
+            return response
+        return wrapper
+    return decorator
 
 # --- API Routes ---
 
 @app.route('/api/preview', methods=['POST', 'GET'])
+@admission_controlled(preview_admission, "PREVIEW_MAX_BYTES")
+@profiled("preview")
 def preview_image():
     """
     Processes an example image with the provided settings and returns the result.
@@ -30,36 +208,44 @@ def preview_image():
     """
     if request.method == 'POST':
         # Get settings from the JSON body of the request
-        settings = request.get_json()
+        settings = request.get_json(silent=True)
+        if not isinstance(settings, dict):
+            return jsonify({'error': 'Expected a JSON object of settings.'}), 400
     else: # For the initial GET request
         settings = {}
 
     # Parse and validate settings from the frontend
-    parsed_settings = {
-        'grid_width': int(settings.get('grid_width', 18)),
-        'grid_height': int(settings.get('grid_height', 11)),
-        'enhance_contrast': settings.get('enhance_contrast', True),
-        'sigmoid_k': float(settings.get('sigmoid_k', 0.042)),
-        'sigmoid_center': float(settings.get('sigmoid_center', 175.0)),
-        'filter_threshold': int(settings.get('filter_threshold', 5)),
-        'dimming_threshold': int(settings.get('dimming_threshold', 15)),
-        'cell_aspect_ratio': float(settings.get('cell_aspect_ratio', 1.6))
-    }
+    try:
+        parsed_settings = {
+            'grid_width': int(settings.get('grid_width', 18)),
+            'grid_height': int(settings.get('grid_height', 11)),
+            'enhance_contrast': settings.get('enhance_contrast', True),
+            'sigmoid_k': float(settings.get('sigmoid_k', 0.042)),
+            'sigmoid_center': float(settings.get('sigmoid_center', 175.0)),
+            'filter_threshold': int(settings.get('filter_threshold', 5)),
+            'dimming_threshold': int(settings.get('dimming_threshold', 15)),
+            'cell_aspect_ratio': float(settings.get('cell_aspect_ratio', 1.6))
+        }
+        pixelator = Pixelator(parsed_settings)
+    except (TypeError, ValueError, OverflowError) as e:
+        return jsonify({'error': f"Invalid settings: {str(e)}"}), 400
 
     example_image_path = os.path.join(app.root_path, 'example_image.png')
     if not os.path.exists(example_image_path):
         return "Example image not found on server.", 404
 
     # Generate the preview image in memory
-    img_io = generate_live_preview(example_image_path, parsed_settings)
-    
-    if img_io:
-        return send_file(img_io, mimetype='image/png')
-    else:
+    try:
+        png_bytes = pixelator.preview_png(example_image_path)
+    except Exception as e:
+        logger.error("Failed to generate preview: %s", e)
         return "Failed to generate preview.", 500
+    return send_file(io.BytesIO(png_bytes), mimetype='image/png')
 
 
 @app.route('/upload', methods=['POST'])
+@admission_controlled(upload_admission, "UPLOAD_MAX_BYTES")
+@profiled("upload")
 def upload_file():
     """
     Handles file uploads, processes them, and returns the C code as JSON.
@@ -73,68 +259,83 @@ def upload_file():
 
     if file:
         filename = secure_filename(file.filename)
-        temp_dir = os.path.join(app.config['UPLOAD_FOLDER'], filename + "_temp")
-        os.makedirs(temp_dir, exist_ok=True)
-        
-        saved_path = os.path.join(temp_dir, filename)
-        file.save(saved_path)
-
         struct_name = request.form.get('struct_name', 'my_animation')
         c_code_output = ""
         error_message = ""
         
-        settings = {
-            'grid_width': int(request.form.get('grid_width', 18)),
-            'grid_height': int(request.form.get('grid_height', 11)),
-            'enhance_contrast': request.form.get('enhance_contrast') == 'true',
-            'sigmoid_k': float(request.form.get('sigmoid_k', 0.042)),
-            'sigmoid_center': float(request.form.get('sigmoid_center', 175.0)),
-            'filter_threshold': int(request.form.get('filter_threshold', 5)),
-            'dimming_threshold': int(request.form.get('dimming_threshold', 15)),
-            'fps': int(request.form.get('fps', 30)),
-            'video_fps': int(request.form.get('video_fps', 10)),
-            'generate_video': request.form.get('generate_video') == 'true',
-            'cell_aspect_ratio': float(request.form.get('cell_aspect_ratio', 1.6))
-        }
-        
+        # Settings are checked before anything is written, so a bad request leaves nothing behind
         try:
-            if filename.lower().endswith(('.png', '.jpg', '.jpeg')):
-                c_code_output = process_image_and_generate_c_code(saved_path, struct_name, settings)
-            
-            elif filename.lower().endswith(('.mp4', '.mov')):
-                temp_frames_dir = os.path.join(temp_dir, "frames")
-                os.makedirs(temp_frames_dir, exist_ok=True)
-                slice_video_to_frames(saved_path, temp_frames_dir, settings['fps'])
-                if not os.listdir(temp_frames_dir):
-                    error_message = "Could not extract frames from video."
-                else:
-                    c_code_output = process_directory_and_generate_c_code(temp_frames_dir, struct_name, settings)
+            settings = {
+                'grid_width': int(request.form.get('grid_width', 18)),
+                'grid_height': int(request.form.get('grid_height', 11)),
+                'enhance_contrast': request.form.get('enhance_contrast') == 'true',
+                'sigmoid_k': float(request.form.get('sigmoid_k', 0.042)),
+                'sigmoid_center': float(request.form.get('sigmoid_center', 175.0)),
+                'filter_threshold': int(request.form.get('filter_threshold', 5)),
+                'dimming_threshold': int(request.form.get('dimming_threshold', 15)),
+                'fps': int(request.form.get('fps', 30)),
+                'video_fps': int(request.form.get('video_fps', 10)),
+                'generate_video': request.form.get('generate_video') == 'true',
+                'cell_aspect_ratio': float(request.form.get('cell_aspect_ratio', 1.6)),
+                'encoding': request.form.get('encoding', C_ENCODING),
+                'flash_budget_bytes': int(request.form.get('flash_budget_bytes') or 0) or None,
+            }
+            validate_settings(settings)
+            if not C_IDENTIFIER_PATTERN.match(struct_name):
+                raise ValueError(f"'{struct_name}' is not a valid C identifier")
+        except ValueError as e:
+            return jsonify({'error': f"Invalid settings: {str(e)}"}), 400
 
-            elif filename.lower().endswith('.zip'):
-                temp_zip_dir = os.path.join(temp_dir, "zip_contents")
-                os.makedirs(temp_zip_dir, exist_ok=True)
-                with zipfile.ZipFile(saved_path, 'r') as zip_ref:
-                    zip_ref.extractall(temp_zip_dir)
-                c_code_output = process_directory_and_generate_c_code(temp_zip_dir, struct_name, settings)
+        try:
+            variants = parse_variants(request.form.get('variants'), settings)
+        except ValueError as e:
+            return jsonify({'error': f"Invalid variants: {str(e)}"}), 400
+        
+        with Workspace() as workspace:
+            saved_path = workspace.path("upload", filename)
+            file.save(saved_path)
 
-            else:
-                error_message = "Unsupported file type."
+            try:
+                if filename.lower().endswith(('.png', '.jpg', '.jpeg')):
+                    c_code_output = process_image_and_generate_c_code(saved_path, struct_name, settings, variants, workspace)
+                
+                elif filename.lower().endswith(('.mp4', '.mov')):
+                    c_code_output = process_video_and_generate_c_code(saved_path, struct_name, settings, variants, workspace)
 
-        except Exception as e:
-            print(f"An error occurred during processing: {str(e)}")
-            error_message = f"An internal error occurred: {str(e)}"
-        
-        finally:
-            shutil.rmtree(temp_dir)
+                elif filename.lower().endswith('.zip'):
+                    temp_zip_dir = workspace.makedirs("zip_contents")
+                    with zipfile.ZipFile(saved_path, 'r') as zip_ref:
+                        zip_ref.extractall(temp_zip_dir)
+                    c_code_output = process_directory_and_generate_c_code(temp_zip_dir, struct_name, settings, variants, workspace)
+
+                else:
+                    error_message = "Unsupported file type."
+
+                # Footprint reports stay in the workspace, so collect them (and own headers) before it is removed
+                if isinstance(c_code_output, dict):
+                    footprints = {name: load_footprint_report(workspace, name) for name in c_code_output}
+                    headers = {name: load_animation_header(workspace, name) for name in c_code_output}
+                else:
+                    footprint = load_footprint_report(workspace, struct_name)
+                    header = load_animation_header(workspace, struct_name)
+
+            except FlashBudgetError as e:
+                return jsonify({'error': str(e)}), 400
+            except Exception as e:
+                logger.exception("An error occurred during processing: %s", e)
+                error_message = f"An internal error occurred: {str(e)}"
 
         if error_message:
             return jsonify({'error': error_message}), 500
         
-        if not c_code_output or "Error:" in c_code_output:
+        if isinstance(c_code_output, dict):
+            return variants_response(c_code_output, struct_name, request.form.get('variants_format') == 'zip', footprints, headers)
+        
+        if not c_code_output or c_code_output.startswith("Error"):
              return jsonify({'error': c_code_output or "C-code generation failed."}), 500
         
         else:
-            return jsonify({'c_code': c_code_output, 'struct_name': struct_name})
+            return jsonify({'c_code': c_code_output, 'header': header, 'struct_name': struct_name, 'footprint': footprint})
 
 # --- (Keep the video serving routes as they are, but use app.root_path) ---
 # ... from line 140 to the end of the file ...
@@ -143,23 +344,91 @@ def list_videos():
     """
     Lists all generated animation videos.
     """
-    videos = []
-    output_base = os.path.join(app.root_path, "output_images")
-    
-    if os.path.exists(output_base):
-        for folder in os.listdir(output_base):
-            folder_path = os.path.join(output_base, folder)
-            if os.path.isdir(folder_path):
-                for file in os.listdir(folder_path):
-                    if file.endswith('.mp4') and not file.endswith('_old.mp4'):
-                        videos.append({
-                            'name': file,
-                            'folder': folder,
-                            'path': f"/video/{folder}/{file}",
-                            'size': os.path.getsize(os.path.join(folder_path, file))
-                        })
-    
-    return jsonify(videos)
+    return jsonify(get_artifact_store().list_videos())
+
+@app.route('/api/bundle', methods=['POST'])
+@admin_required
+def create_bundle():
+    """
+    Bundles published animations into one deduplicated frame pool.
+    Expects JSON with 'bundle_name' and a list of 'animations' (struct names).
+    """
+    data = request.get_json(silent=True) or {}
+    bundle_name = secure_filename(data.get('bundle_name') or '')
+    animations = data.get('animations')
+    if not bundle_name or not isinstance(animations, list) or not animations:
+        return jsonify({'error': "Expected 'bundle_name' and a non-empty 'animations' list."}), 400
+
+    try:
+        bundle = bundle_registered_animations(bundle_name, [secure_filename(str(name)) for name in animations])
+    except FileNotFoundError as e:
+        return jsonify({'error': str(e)}), 404
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify(bundle)
+
+@app.route('/api/metrics')
+def metrics():
+    """
+    Reports the load of the admission-controlled endpoints, including queue depth.
+    """
+    return jsonify({
+        'upload': upload_admission.stats(),
+        'preview': preview_admission.stats(),
+    })
+
+@app.route('/api/admin/storage')
+@admin_required
+def storage_usage():
+    """
+    Shows disk usage of the generated animations against the quota, least recently used first.
+    """
+    return jsonify(get_artifact_store().usage())
+
+@app.route('/api/admin/storage/<struct_name>', methods=['DELETE'])
+@admin_required
+def evict_animation(struct_name):
+    """
+    Removes one animation's videos, previews, C file and header declaration.
+    """
+    if not get_artifact_store().evict(secure_filename(struct_name)):
+        return jsonify({'error': f"Unknown animation '{struct_name}'"}), 404
+    return jsonify({'evicted': struct_name})
+
+@app.route('/api/admin/profiles')
+@admin_required
+def list_profiles():
+    """
+    Lists the stored request profiles, newest first.
+    """
+    return jsonify(get_profile_store().list())
+
+@app.route('/api/admin/profiles/<profile_id>')
+@admin_required
+def download_profile(profile_id):
+    """
+    Downloads one profile as collapsed stacks (default, for flame graphs) or with ?format=pstats.
+    """
+    store = get_profile_store()
+    profile_format = request.args.get('format', 'collapsed')
+    if profile_format == 'pstats':
+        pstats_path = store.pstats_path(profile_id)
+        if pstats_path is None:
+            return jsonify({'error': f"Unknown profile '{profile_id}'"}), 404
+        return send_file(pstats_path, mimetype='application/octet-stream', as_attachment=True,
+                         download_name=f"{profile_id}.pstats")
+    if profile_format != 'collapsed':
+        return jsonify({'error': "format must be 'collapsed' or 'pstats'"}), 400
+
+    collapsed = store.collapsed(profile_id)
+    if collapsed is None:
+        return jsonify({'error': f"Unknown profile '{profile_id}'"}), 404
+    return Response(collapsed, mimetype='text/plain',
+                    headers={'Content-Disposition': f'attachment; filename={profile_id}.collapsed.txt'})
+
+@app.errorhandler(413)
+def request_too_large(error):
+    return jsonify({'error': f"Request body too large (limit is {request.max_content_length} bytes)."}), 413
 
 @app.route('/video/<folder>/<filename>')
 def serve_video(folder, filename):
@@ -167,7 +436,9 @@ def serve_video(folder, filename):
     Serves a generated video file.
     """
     video_path = os.path.join(app.root_path, "output_images", folder)
-    return send_from_directory(video_path, filename)
+    response = send_from_directory(video_path, filename)
+    get_artifact_store().touch(folder)
+    return response
 
 # --- Main execution ---
 if __name__ == '__main__':
@@ -0,0 +1,214 @@
+# backend/artifact_store.py
+
+import json
+import logging
+import os
+import re
+import shutil
+import time
+
+from workspace import locked_file
+
+logger = logging.getLogger(__name__)
+
+# =============================================================================
+# --- SETTINGS ---
+# =============================================================================
+
+# Total bytes output_images/ and frames_as_c_code/ may use before old animations are evicted.
+ARTIFACT_QUOTA_BYTES = int(os.environ.get("PIXELATOR_ARTIFACT_QUOTA_BYTES", 2 * 1024 * 1024 * 1024))
+# Last-access times are only rewritten when older than this, so serving a video rarely writes the index.
+ACCESS_RESOLUTION_SECONDS = 60
+
+# =============================================================================
+# ARTIFACT STORE
+# =============================================================================
+
+def strip_declarations(header, struct_name):
+    """A header's text without the extern declarations of one animation, in any encoding."""
+    declaration = re.compile(
+        rf"^extern const \w+ {re.escape(struct_name)}(?:_pixel_indices|_brightness_levels)?\[\d+\];\n?", re.MULTILINE)
+    return declaration.sub('', header)
+
+def get_dir_size(path):
+    total = 0
+    for dirpath, _, filenames in os.walk(path):
+        for filename in filenames:
+            total += os.path.getsize(os.path.join(dirpath, filename))
+    return total
+
+class ArtifactStore:
+    """
+    Tracks every published animation (its preview folder, video, .c file and own .h, if any)
+    in a small JSON index with sizes and last-access times, and evicts the
+    least recently used animations once the byte quota is exceeded.
+    The index also serves the video listing, so no directory scan is needed per request.
+    """
+
+    def __init__(self, backend_dir, quota_bytes=ARTIFACT_QUOTA_BYTES):
+        self.backend_dir = backend_dir
+        self.quota_bytes = quota_bytes
+        self.output_images_dir = os.path.join(backend_dir, "output_images")
+        self.c_code_dir = os.path.join(backend_dir, "frames_as_c_code")
+        self.header_path = os.path.join(backend_dir, "frames_as_c_code.h")
+        self.index_path = os.path.join(backend_dir, "artifact_index.json")
+
+    # --- Index ---
+
+    def _load_index(self):
+        """Read the index; callers hold the index lock. A missing or corrupt index is rebuilt and saved once."""
+        try:
+            with open(self.index_path, 'r') as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            pass
+        index = self._scan_index()
+        self._enforce_quota(index)
+        self._save_index(index)
+        return index
+
+    def _save_index(self, index):
+        temp_path = self.index_path + ".tmp"
+        with open(temp_path, 'w') as f:
+            json.dump(index, f, indent=2, sort_keys=True)
+        os.replace(temp_path, self.index_path)
+
+    def _scan_index(self):
+        """Rebuild the index from disk. Only needed when the index file is missing or corrupt."""
+        names = set()
+        if os.path.isdir(self.output_images_dir):
+            names.update(d for d in os.listdir(self.output_images_dir)
+                         if os.path.isdir(os.path.join(self.output_images_dir, d)) and not d.startswith('.'))
+        if os.path.isdir(self.c_code_dir):
+            names.update(os.path.splitext(f)[0] for f in os.listdir(self.c_code_dir) if f.endswith('.c'))
+        return {name: self._describe(name) for name in names}
+
+    def _describe(self, struct_name, last_access=None):
+        animation_dir = os.path.join(self.output_images_dir, struct_name)
+        c_path = os.path.join(self.c_code_dir, f"{struct_name}.c")
+        h_path = os.path.join(self.c_code_dir, f"{struct_name}.h")
+        video_name = f"{struct_name}_animation.mp4"
+        video_path = os.path.join(animation_dir, video_name)
+
+        size = get_dir_size(animation_dir) if os.path.isdir(animation_dir) else 0
+        for path in (c_path, h_path):
+            if os.path.exists(path):
+                size += os.path.getsize(path)
+        if last_access is None:
+            paths = [p for p in (animation_dir, c_path) if os.path.exists(p)]
+            last_access = max((os.path.getmtime(p) for p in paths), default=time.time())
+
+        return {
+            'bytes': size,
+            'last_access': last_access,
+            'video': video_name if os.path.exists(video_path) else None,
+            'video_bytes': os.path.getsize(video_path) if os.path.exists(video_path) else 0,
+        }
+
+    # --- Public API ---
+
+    def record(self, struct_name):
+        """Register a freshly published animation and evict old ones if over quota."""
+        with locked_file(self.index_path):
+            index = self._load_index()
+            index[struct_name] = self._describe(struct_name, last_access=time.time())
+            evicted = self._enforce_quota(index, keep=struct_name)
+            self._save_index(index)
+        return evicted
+
+    def touch(self, struct_name):
+        """Mark an animation as used (e.g. its video was served)."""
+        now = time.time()
+        with locked_file(self.index_path):
+            index = self._load_index()
+            entry = index.get(struct_name)
+            if entry is None or now - entry['last_access'] < ACCESS_RESOLUTION_SECONDS:
+                return
+            entry['last_access'] = now
+            self._save_index(index)
+
+    def evict(self, struct_name):
+        """Remove one animation's files, index entry and header declarations."""
+        with locked_file(self.index_path):
+            index = self._load_index()
+            if struct_name not in index:
+                return False
+            self._evict(index, struct_name)
+            self._save_index(index)
+        return True
+
+    def usage(self):
+        """Quota usage with all animations, least recently used first."""
+        with locked_file(self.index_path):
+            index = self._load_index()
+        entries = sorted(index.items(), key=lambda item: item[1]['last_access'])
+        used = sum(entry['bytes'] for _, entry in entries)
+        return {
+            'quota_bytes': self.quota_bytes,
+            'used_bytes': used,
+            'animations': [dict(entry, struct_name=name) for name, entry in entries],
+        }
+
+    def list_videos(self):
+        """Videos of all stored animations, in the format of the /api/videos listing."""
+        with locked_file(self.index_path):
+            index = self._load_index()
+        return [
+            {
+                'name': entry['video'],
+                'folder': name,
+                'path': f"/video/{name}/{entry['video']}",
+                'size': entry['video_bytes'],
+            }
+            for name, entry in sorted(index.items())
+            if entry.get('video')
+        ]
+
+    # --- Eviction ---
+
+    def _enforce_quota(self, index, keep=None):
+        evicted = []
+        used = sum(entry['bytes'] for entry in index.values())
+        for name, entry in sorted(index.items(), key=lambda item: item[1]['last_access']):
+            if used <= self.quota_bytes:
+                break
+            if name == keep:
+                continue
+            used -= entry['bytes']
+            self._evict(index, name)
+            evicted.append(name)
+        if evicted:
+            logger.info("🧹 Evicted %d animations to stay within the %d byte quota: %s",
+                        len(evicted), self.quota_bytes, ', '.join(evicted))
+        return evicted
+
+    def _evict(self, index, struct_name):
+        del index[struct_name]
+        shutil.rmtree(os.path.join(self.output_images_dir, struct_name), ignore_errors=True)
+        for extension in (".c", ".h"):
+            path = os.path.join(self.c_code_dir, struct_name + extension)
+            if os.path.exists(path):
+                os.remove(path)
+        self.remove_declarations(struct_name)
+
+    def remove_declarations(self, struct_name):
+        """Drop an animation's extern declarations from the shared header."""
+        with locked_file(self.header_path):
+            try:
+                with open(self.header_path, 'r') as h_file:
+                    header = h_file.read()
+            except FileNotFoundError:
+                return
+            updated = strip_declarations(header, struct_name)
+            if updated != header:
+                with open(self.header_path, 'w') as h_file:
+                    h_file.write(updated)
+
+_default_store = None
+
+def get_artifact_store():
+    """The store for this backend folder."""
+    global _default_store
+    if _default_store is None:
+        _default_store = ArtifactStore(os.path.dirname(os.path.abspath(__file__)))
+    return _default_store
@@ -0,0 +1,291 @@
+# backend/frame_bundle.py
+#
+# Bundles several generated animations into one shared, deduplicated frame pool.
+# Every distinct frame grid is stored once; each animation becomes a sequence of
+# indices into the pool, read through an accessor in the bundle's header.
+#
+#   python3 frame_bundle.py firmware_anims scary_man idle_anim blink --report bundle.json
+
+import argparse
+import hashlib
+import json
+import logging
+import os
+import re
+import sys
+
+import numpy as np
+
+from pixelate_and_convert import (
+    GRID_WIDTH,
+    GRID_HEIGHT,
+    C_ENCODING,
+    C_IDENTIFIER_PATTERN,
+    generate_c_frame_block,
+    generate_frame_typedef,
+    generate_matrix_defines,
+    get_dense_frame_bytes,
+    get_frame_type,
+    get_output_paths,
+    measure_footprint,
+    sanitize_struct_name,
+)
+from workspace import Workspace
+
+logger = logging.getLogger(__name__)
+
+# =============================================================================
+# --- SETTINGS ---
+# =============================================================================
+
+BUNDLE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "frames_as_c_code", "bundles")
+
+# =============================================================================
+# READING GENERATED ANIMATIONS
+# =============================================================================
+
+DEFINE_PATTERN = re.compile(r"^#define ANIMATION_MATRIX_(WIDTH|HEIGHT) (\d+)$", re.MULTILINE)
+DENSE_FRAME_PATTERN = re.compile(r"\.frame_number = (\d+),\s*\.num_pixels = \d+,\s*\.brightness_levels = \{(.*?)\}", re.DOTALL)
+DENSE_PIXEL_PATTERN = re.compile(r"\[ANIMATION_PIXEL_INDEX\((\d+), (\d+)\)\] = (\d+)")
+SPARSE_ARRAY_PATTERN = r"const \w+ {name}_{array}\[\d+\] = \{{(.*?)\}};"
+SPARSE_FRAME_PATTERN = re.compile(r"\.first_pixel = (\d+), \.num_pixels = (\d+), \.frame_number = (\d+)")
+C_COMMENT_PATTERN = re.compile(r"/\*.*?\*/")
+
+def load_c_animation(c_path, struct_name):
+    """
+    Read the frame grids back from a C file written by the pixelator, in either encoding.
+    Returns (grids, frame_numbers, settings) with settings holding the grid size and encoding.
+    """
+    with open(c_path, 'r') as f:
+        c_code = f.read()
+
+    settings = {'grid_width': GRID_WIDTH, 'grid_height': GRID_HEIGHT}
+    for axis, value in DEFINE_PATTERN.findall(c_code):
+        settings['grid_width' if axis == 'WIDTH' else 'grid_height'] = int(value)
+    grid_width, grid_height = settings['grid_width'], settings['grid_height']
+
+    grids, frame_numbers = [], []
+    settings['encoding'] = 'sparse' if f"animation_sparse_frame {struct_name}[" in c_code else 'dense'
+    if settings['encoding'] == 'sparse':
+        arrays = {}
+        for array in ('pixel_indices', 'brightness_levels'):
+            match = re.search(SPARSE_ARRAY_PATTERN.format(name=re.escape(struct_name), array=array), c_code, re.DOTALL)
+            if match is None:
+                raise ValueError(f"'{c_path}' has no {struct_name}_{array} array")
+            arrays[array] = [int(v) for v in C_COMMENT_PATTERN.sub('', match.group(1)).replace(',', ' ').split()]
+        for first_pixel, num_pixels, frame_number in SPARSE_FRAME_PATTERN.findall(c_code):
+            grid = np.zeros(grid_width * grid_height, dtype=np.uint8)
+            pixels = slice(int(first_pixel), int(first_pixel) + int(num_pixels))
+            grid[arrays['pixel_indices'][pixels]] = arrays['brightness_levels'][pixels]
+            grids.append(grid.reshape(grid_height, grid_width))
+            frame_numbers.append(int(frame_number))
+    else:
+        for frame_number, body in DENSE_FRAME_PATTERN.findall(c_code):
+            grid = np.zeros((grid_height, grid_width), dtype=np.uint8)
+            for y, x, brightness in DENSE_PIXEL_PATTERN.findall(body):
+                grid[int(y), int(x)] = int(brightness)
+            grids.append(grid)
+            frame_numbers.append(int(frame_number))
+
+    if not grids:
+        raise ValueError(f"No frames found for '{struct_name}' in '{c_path}'")
+    return grids, frame_numbers, settings
+
+def load_registered_animation(struct_name):
+    """Frames of a published animation, from its C file in frames_as_c_code/."""
+    c_output_path, _ = get_output_paths(struct_name)
+    if not os.path.exists(c_output_path):
+        raise FileNotFoundError(f"Unknown animation '{struct_name}'")
+    return load_c_animation(c_output_path, struct_name)
+
+# =============================================================================
+# BUNDLE GENERATION
+# =============================================================================
+
+def hash_grid(grid):
+    return hashlib.sha1(np.ascontiguousarray(grid, dtype=np.uint8).tobytes()).hexdigest()
+
+def build_frame_bundle(bundle_name, animations):
+    """
+    Deduplicate the frames of several animations into one pool.
+    animations is a list of (struct_name, grids, settings); all must share one grid size.
+    Returns {'c_code', 'header', 'report'}; nothing is written to disk.
+    """
+    if not animations:
+        raise ValueError("A bundle needs at least one animation")
+    settings = animations[0][2]
+    grid_size = (settings['grid_width'], settings['grid_height'])
+    for struct_name, _, animation_settings in animations:
+        if (animation_settings['grid_width'], animation_settings['grid_height']) != grid_size:
+            raise ValueError(f"'{struct_name}' is {animation_settings['grid_width']}x{animation_settings['grid_height']}, "
+                             f"the bundle is {grid_size[0]}x{grid_size[1]}: bundled animations must share a grid size")
+
+    pool = []
+    pool_index_by_hash = {}
+    sequences = []
+    for struct_name, grids, _ in animations:
+        sequence = []
+        for grid in grids:
+            key = hash_grid(grid)
+            if key not in pool_index_by_hash:
+                pool_index_by_hash[key] = len(pool)
+                pool.append(grid)
+            sequence.append(pool_index_by_hash[key])
+        sequences.append((struct_name, sequence))
+
+    report = measure_bundle(bundle_name, animations, pool, sequences, settings)
+    matrix_defines = grid_size != (GRID_WIDTH, GRID_HEIGHT)
+    return {
+        'c_code': "".join(generate_bundle_c_code(bundle_name, pool, sequences, report['index_type'], settings, matrix_defines)),
+        'header': "".join(generate_bundle_header(bundle_name, len(pool), sequences, report['index_type'], settings)),
+        'report': report,
+    }
+
+def measure_bundle(bundle_name, animations, pool, sequences, settings):
+    """
+    Bytes of the animations as separate arrays, each in its own encoding ('encoding' in its
+    settings, dense if unset), versus as a shared dense pool plus index sequences.
+    """
+    frame_bytes = get_dense_frame_bytes(settings)
+    index_type = 'uint8_t' if len(pool) <= 256 else 'uint16_t'
+    index_bytes = 1 if index_type == 'uint8_t' else 2
+
+    per_animation = []
+    for (struct_name, grids, animation_settings), (_, sequence) in zip(animations, sequences):
+        encoding = animation_settings.get('encoding', C_ENCODING)
+        active_pixels = [int(np.count_nonzero(grid)) for grid in grids]
+        per_animation.append({
+            'struct_name': struct_name,
+            'encoding': encoding,
+            'frames': len(grids),
+            'unique_frames': len(set(sequence)),
+            'separate_bytes': measure_footprint(active_pixels, animation_settings)[encoding],
+            'sequence_bytes': len(sequence) * index_bytes,
+        })
+
+    total_frames = sum(entry['frames'] for entry in per_animation)
+    separate_bytes = sum(entry['separate_bytes'] for entry in per_animation)
+    bundle_bytes = len(pool) * frame_bytes + sum(entry['sequence_bytes'] for entry in per_animation)
+    return {
+        'bundle_name': bundle_name,
+        'grid_width': settings['grid_width'],
+        'grid_height': settings['grid_height'],
+        'index_type': index_type,
+        'total_frames': total_frames,
+        'pool_frames': len(pool),
+        'separate_bytes': separate_bytes,
+        'bundle_bytes': bundle_bytes,
+        'bytes_saved': separate_bytes - bundle_bytes,
+        'animations': per_animation,
+    }
+
+def generate_bundle_c_code(bundle_name, pool, sequences, index_type, settings, matrix_defines=False):
+    c_code = [
+        '// Generated by the pixelator script.\n',
+        f'// Deduplicated frame pool shared by: {", ".join(name for name, _ in sequences)}.\n',
+    ]
+    # Only this file needs ANIMATION_PIXEL_INDEX for the bundle's grid; the header stays free of the defines
+    if matrix_defines:
+        c_code.extend(generate_matrix_defines(settings))
+    c_code.extend([
+        f'#include "{bundle_name}.h"\n\n',
+        f'const {get_frame_type(settings)} {bundle_name}_pool[{len(pool)}] = {{\n',
+    ])
+    for pool_index, grid in enumerate(pool):
+        c_code.extend(generate_c_frame_block(grid, pool_index, settings))
+    c_code.append('};\n')
+
+    for struct_name, sequence in sequences:
+        c_code.append(f'\nconst {index_type} {struct_name}_sequence[{len(sequence)}] = {{\n')
+        for start in range(0, len(sequence), 16):
+            c_code.append(f'    {"".join(f"{i}, " for i in sequence[start:start + 16]).rstrip()}\n')
+        c_code.append('};\n')
+    return c_code
+
+def generate_bundle_header(bundle_name, pool_size, sequences, index_type, settings):
+    guard = f"{bundle_name.upper()}_H"
+    h_code = [
+        '// Generated by the pixelator script.\n',
+        f'#ifndef {guard}\n',
+        f'#define {guard}\n\n',
+    ]
+    frame_type = get_frame_type(settings)
+    h_code.append('#include "frames_as_c_code.h"\n\n')
+    if frame_type != 'animation_frame':
+        h_code.extend(generate_frame_typedef(settings))
+        h_code.append('\n')
+    h_code.extend([
+        f'#define {bundle_name.upper()}_POOL_SIZE {pool_size}\n',
+        f'extern const {frame_type} {bundle_name}_pool[{pool_size}];\n',
+    ])
+    for struct_name, sequence in sequences:
+        h_code.extend([
+            f'\n#define {struct_name.upper()}_FRAME_COUNT {len(sequence)}\n',
+            f'extern const {index_type} {struct_name}_sequence[{len(sequence)}];\n',
+            f'static inline const {frame_type} *{struct_name}_frame(uint16_t index) {{\n',
+            f'    return &{bundle_name}_pool[{struct_name}_sequence[index]];\n',
+            '}\n',
+        ])
+    h_code.append(f'\n#endif // {guard}\n')
+    return h_code
+
+def bundle_registered_animations(bundle_name, struct_names, output_dir=BUNDLE_DIR):
+    """
+    Build a bundle from published animations and write <bundle_name>.c and .h to output_dir.
+    Returns the bundle (C code, header and report).
+    """
+    bundle_name = sanitize_struct_name(bundle_name)
+    if not C_IDENTIFIER_PATTERN.match(bundle_name):
+        raise ValueError(f"'{bundle_name}' is not a valid C identifier")
+    animations = []
+    for struct_name in dict.fromkeys(struct_names):
+        grids, _, settings = load_registered_animation(struct_name)
+        animations.append((struct_name, grids, settings))
+    bundle = build_frame_bundle(bundle_name, animations)
+
+    with Workspace() as workspace:
+        for extension, content in (('.c', bundle['c_code']), ('.h', bundle['header'])):
+            staged_path = workspace.path(bundle_name + extension)
+            with open(staged_path, 'w') as f:
+                f.write(content)
+            workspace.publish_file(staged_path, os.path.join(output_dir, bundle_name + extension))
+
+    report = bundle['report']
+    logger.info("📦 Bundled %d animations into %d pool frames (of %d), saving %d bytes: %s",
+                len(animations), report['pool_frames'], report['total_frames'], report['bytes_saved'],
+                os.path.join(output_dir, bundle_name + '.c'))
+    return bundle
+
+# =============================================================================
+# COMMAND LINE
+# =============================================================================
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Bundle generated animations into one deduplicated frame pool.")
+    parser.add_argument('bundle_name', help="Name of the bundle; also the prefix of its pool and header.")
+    parser.add_argument('struct_names', nargs='+', help="Published animations (files in frames_as_c_code/) to bundle.")
+    parser.add_argument('--output-dir', default=BUNDLE_DIR, help="Where <bundle_name>.c and .h are written.")
+    parser.add_argument('--report', help="Write the bytes-saved report as JSON to this path.")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level="INFO", format="%(message)s")
+
+    try:
+        bundle = bundle_registered_animations(args.bundle_name, args.struct_names, args.output_dir)
+    except (OSError, ValueError) as e:
+        parser.error(str(e))
+
+    report = bundle['report']
+    print(f"\n📊 Bundle {report['bundle_name']} ({report['grid_width']}x{report['grid_height']}):")
+    for entry in report['animations']:
+        print(f"   {entry['struct_name']:<30} {entry['frames']:>6} frames  {entry['unique_frames']:>6} unique  ({entry['encoding']})")
+    print(f"💾 {report['pool_frames']}/{report['total_frames']} frames kept: "
+          f"{report['separate_bytes']} B -> {report['bundle_bytes']} B ({report['bytes_saved']} B saved)")
+
+    if args.report:
+        with open(args.report, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"📝 Report written to {args.report}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -7,9 +7,18 @@
 // Animation Struct and Constants
 // ============================================================================
 
-#define ANIMATION_MAX_ACTIVE_PIXELS (18 * 11)
+// Defaults for the 18x11 matrix. Generated files for other matrix sizes
+// define these before including this header, and declare their animations in
+// their own <name>.h with a frame type for that size (e.g. animation_frame_32x16).
+#ifndef ANIMATION_MATRIX_WIDTH
 #define ANIMATION_MATRIX_WIDTH 18
+#endif
+#ifndef ANIMATION_MATRIX_HEIGHT
 #define ANIMATION_MATRIX_HEIGHT 11
+#endif
+#ifndef ANIMATION_MAX_ACTIVE_PIXELS
+#define ANIMATION_MAX_ACTIVE_PIXELS (ANIMATION_MATRIX_WIDTH * ANIMATION_MATRIX_HEIGHT)
+#endif
 
 // Macro to convert 2D coordinates to a 1D array index.
 #define ANIMATION_PIXEL_INDEX(y, x) ((y) * ANIMATION_MATRIX_WIDTH + (x))
@@ -21,6 +30,16 @@ typedef struct {
     uint8_t num_pixels;
 } animation_frame;
 
+// A frame in the sparse encoding. Only lit pixels are stored, in two arrays shared
+// by all frames of an animation: <name>_pixel_indices (ANIMATION_PIXEL_INDEX values,
+// uint8_t for grids of up to 256 pixels, else uint16_t) and <name>_brightness_levels.
+// The frame's pixels are entries first_pixel .. first_pixel + num_pixels - 1.
+typedef struct {
+    uint32_t first_pixel;
+    uint16_t num_pixels;
+    uint16_t frame_number; // Index of this frame in an animation
+} animation_sparse_frame;
+
 // ============================================================================
 // Extern Declarations for Animation Data
 // ============================================================================
@@ -0,0 +1,449 @@
+# backend/load_test.py
+#
+# Load generator for the Flask endpoints. Starts the server locally (or targets --url),
+# runs scripted traffic scenarios against it with synthetic fixtures and reports
+# throughput, latency percentiles, error rates and the server's peak RSS.
+#
+#   python3 load_test.py                                  # all scenarios against a local dev server
+#   python3 load_test.py mixed --duration 30 --report load.json
+#   python3 load_test.py --server-command "gunicorn -w 4 -b 127.0.0.1:{port} app:app"
+
+import argparse
+import http.client
+import json
+import math
+import os
+import random
+import shlex
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from urllib.parse import urlsplit
+
+import cv2
+import numpy as np
+
+# =============================================================================
+# --- SETTINGS ---
+# =============================================================================
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_SERVER_COMMAND = (f"{shlex.quote(sys.executable)} -c "
+                          "\"from app import app; app.run(host='127.0.0.1', port={port}, threaded=True)\"")
+SERVER_START_TIMEOUT = 30   # Seconds to wait for a started server to answer
+RSS_SAMPLE_INTERVAL = 0.05  # Seconds between server memory samples
+REQUEST_TIMEOUT = 120       # Seconds before a single request counts as failed
+STRUCT_PREFIX = "loadtest_" # Animations uploaded by the load test, removed again afterwards
+
+# Synthetic upload clip
+FIXTURE_VIDEO_SECONDS = 2
+FIXTURE_VIDEO_FPS = 30
+FIXTURE_VIDEO_SIZE = (320, 240)
+
+# =============================================================================
+# SYNTHETIC FIXTURES
+# =============================================================================
+
+def make_fixture_video(path, seconds=FIXTURE_VIDEO_SECONDS, fps=FIXTURE_VIDEO_FPS, size=FIXTURE_VIDEO_SIZE):
+    """A short clip of a bright disc moving over a gradient, so frames differ and pixels pass the filters."""
+    width, height = size
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*'mp4v'), fps, size)
+    gradient = np.tile(np.linspace(0, 120, width, dtype=np.uint8), (height, 1))
+    frame_count = seconds * fps
+    for i in range(frame_count):
+        frame = cv2.cvtColor(gradient, cv2.COLOR_GRAY2BGR)
+        x = int(width * i / frame_count)
+        cv2.circle(frame, (x, height // 2), height // 4, (255, 255, 255), -1)
+        writer.write(frame)
+    writer.release()
+    with open(path, 'rb') as f:
+        return f.read()
+
+def random_preview_settings():
+    """Settings as sent by the frontend while a slider is dragged."""
+    return {
+        'grid_width': random.choice([18, 18, 24, 32]),
+        'grid_height': random.choice([11, 11, 16]),
+        'enhance_contrast': random.random() < 0.8,
+        'sigmoid_k': round(random.uniform(0.01, 0.1), 3),
+        'sigmoid_center': round(random.uniform(100, 220), 1),
+        'filter_threshold': random.randint(0, 30),
+        'dimming_threshold': random.randint(10, 60),
+        'cell_aspect_ratio': 1.6,
+    }
+
+def encode_multipart(fields, files):
+    """Encode form fields and (name, filename, bytes, content type) files as multipart/form-data."""
+    boundary = uuid.uuid4().hex
+    body = []
+    for name, value in fields.items():
+        body.append(f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode())
+    for name, filename, data, content_type in files:
+        body.append(f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"; filename="{filename}"\r\n'
+                    f'Content-Type: {content_type}\r\n\r\n'.encode())
+        body.append(data)
+        body.append(b'\r\n')
+    body.append(f'--{boundary}--\r\n'.encode())
+    return b''.join(body), f'multipart/form-data; boundary={boundary}'
+
+# =============================================================================
+# HTTP CLIENT
+# =============================================================================
+
+class LoadClient:
+    """
+    One simulated user. On Linux every client connects from its own loopback
+    address (127.0.0.2, 127.0.0.3, ...), so the server's per-client admission
+    limits treat them as different users, as they would be in production.
+    """
+
+    def __init__(self, base_url, client_index, distinct_addresses):
+        parts = urlsplit(base_url)
+        self.host = parts.hostname
+        self.port = parts.port or 80
+        self.source_address = None
+        if distinct_addresses:
+            self.source_address = (f"127.0.{(client_index + 2) // 256}.{(client_index + 2) % 256}", 0)
+
+    def request(self, method, path, body=None, headers=None):
+        """Send one request. Returns (status, seconds); status is None when the request failed outright."""
+        connection = http.client.HTTPConnection(self.host, self.port, timeout=REQUEST_TIMEOUT,
+                                                source_address=self.source_address)
+        start = time.perf_counter()
+        try:
+            connection.request(method, path, body=body, headers=headers or {})
+            response = connection.getresponse()
+            response.read()
+            return response.status, time.perf_counter() - start
+        except (OSError, http.client.HTTPException):
+            return None, time.perf_counter() - start
+        finally:
+            connection.close()
+
+def loopback_aliases_available():
+    """Whether sockets can bind to 127.0.0.x addresses other than 127.0.0.1 (true on Linux)."""
+    try:
+        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+            s.bind(("127.0.0.2", 0))
+        return True
+    except OSError:
+        return False
+
+# =============================================================================
+# SCENARIOS
+# =============================================================================
+
+class Recorder:
+    """Collects (kind, status, seconds) samples from all client threads."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.samples = []
+        self.struct_names = set()
+
+    def add(self, kind, status, seconds):
+        with self._lock:
+            self.samples.append((kind, status, seconds))
+
+    def add_struct_name(self, struct_name):
+        with self._lock:
+            self.struct_names.add(struct_name)
+
+def preview_storm_client(client, recorder, stop_event, args):
+    """Drags a slider: a preview render every debounce interval, each waiting for the previous one."""
+    while not stop_event.is_set():
+        body = json.dumps(random_preview_settings()).encode()
+        status, seconds = client.request('POST', '/api/preview', body, {'Content-Type': 'application/json'})
+        recorder.add('preview', status, seconds)
+        stop_event.wait(args.preview_debounce)
+
+def video_upload_client(client, recorder, stop_event, args, video_bytes):
+    """Uploads the synthetic clip, then thinks for a moment before the next upload."""
+    while not stop_event.is_set():
+        struct_name = f"{STRUCT_PREFIX}{uuid.uuid4().hex[:8]}"
+        recorder.add_struct_name(struct_name)
+        body, content_type = encode_multipart(
+            {'struct_name': struct_name, 'fps': args.upload_fps, 'video_fps': args.upload_fps,
+             'generate_video': 'true', 'enhance_contrast': 'true'},
+            [('file', 'loadtest.mp4', video_bytes, 'video/mp4')],
+        )
+        status, seconds = client.request('POST', '/upload', body, {'Content-Type': content_type})
+        recorder.add('upload', status, seconds)
+        stop_event.wait(args.upload_think_time)
+
+def videos_polling_client(client, recorder, stop_event, args):
+    """The video gallery refreshing its listing."""
+    while not stop_event.is_set():
+        status, seconds = client.request('GET', '/api/videos')
+        recorder.add('videos', status, seconds)
+        stop_event.wait(args.poll_interval)
+
+def scenario_clients(name, args):
+    """(client function, count) pairs making up a scenario."""
+    if name == 'preview_storm':
+        return [(preview_storm_client, args.preview_clients)]
+    if name == 'video_uploads':
+        return [(video_upload_client, args.upload_clients)]
+    if name == 'videos_polling':
+        return [(videos_polling_client, args.poll_clients)]
+    if name == 'mixed':
+        return [
+            (preview_storm_client, args.preview_clients),
+            (video_upload_client, max(1, args.upload_clients // 2)),
+            (videos_polling_client, max(1, args.poll_clients // 2)),
+        ]
+    raise ValueError(f"Unknown scenario '{name}'")
+
+SCENARIOS = ('preview_storm', 'video_uploads', 'videos_polling', 'mixed')
+
+def run_scenario(name, base_url, args, video_bytes, server_pid, distinct_addresses):
+    recorder = Recorder()
+    stop_event = threading.Event()
+    threads = []
+    client_index = 0
+    for client_function, count in scenario_clients(name, args):
+        for _ in range(count):
+            client = LoadClient(base_url, client_index, distinct_addresses)
+            client_index += 1
+            extra = (video_bytes,) if client_function is video_upload_client else ()
+            threads.append(threading.Thread(target=client_function, args=(client, recorder, stop_event, args) + extra,
+                                            name=f"{name}-{client_index}", daemon=True))
+
+    rss_monitor = RssMonitor(server_pid)
+    rss_monitor.start()
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    time.sleep(args.duration)
+    stop_event.set()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    peak_rss = rss_monitor.stop()
+
+    return summarize(name, recorder.samples, elapsed, peak_rss), recorder.struct_names
+
+# =============================================================================
+# MEASUREMENTS
+# =============================================================================
+
+def process_tree_rss(pid):
+    """Resident memory in bytes of a process and all its descendants, read from /proc. None if unavailable."""
+    total = 0
+    pending = [pid]
+    page_size = os.sysconf('SC_PAGE_SIZE')
+    while pending:
+        current = pending.pop()
+        try:
+            with open(f"/proc/{current}/statm") as f:
+                total += int(f.read().split()[1]) * page_size
+            for task in os.listdir(f"/proc/{current}/task"):
+                with open(f"/proc/{current}/task/{task}/children") as f:
+                    pending.extend(int(child) for child in f.read().split())
+        except (OSError, ValueError):
+            if current == pid:
+                return None
+    return total
+
+class RssMonitor:
+    """Samples the server's memory in the background and keeps the peak."""
+
+    def __init__(self, pid):
+        self.pid = pid
+        self.peak = None
+        self._stop_event = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        if self.pid is not None:
+            self._thread.start()
+
+    def stop(self):
+        if self.pid is not None:
+            self._stop_event.set()
+            self._thread.join()
+        return self.peak
+
+    def _run(self):
+        while not self._stop_event.is_set():
+            rss = process_tree_rss(self.pid)
+            if rss is not None:
+                self.peak = max(self.peak or 0, rss)
+            self._stop_event.wait(RSS_SAMPLE_INTERVAL)
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return None
+    rank = max(0, min(len(sorted_values) - 1, math.ceil(fraction * len(sorted_values)) - 1))
+    return sorted_values[rank]
+
+def summarize_samples(samples, elapsed):
+    latencies = sorted(seconds for _, _, seconds in samples)
+    rejected = sum(1 for _, status, _ in samples if status in (429, 503))
+    errors = sum(1 for _, status, _ in samples if status is None or (status >= 400 and status not in (429, 503)))
+    return {
+        'requests': len(samples),
+        'throughput_rps': round(len(samples) / elapsed, 2) if elapsed else 0.0,
+        'p50_ms': round(percentile(latencies, 0.50) * 1000, 1) if latencies else None,
+        'p95_ms': round(percentile(latencies, 0.95) * 1000, 1) if latencies else None,
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 1) if latencies else None,
+        'error_rate': round(errors / len(samples), 4) if samples else 0.0,
+        'rejected_rate': round(rejected / len(samples), 4) if samples else 0.0,
+    }
+
+def summarize(name, samples, elapsed, peak_rss):
+    """Overall and per-endpoint figures of one scenario. Admission rejections (429/503) are counted apart from errors."""
+    kinds = sorted({kind for kind, _, _ in samples})
+    summary = summarize_samples(samples, elapsed)
+    summary.update({
+        'scenario': name,
+        'seconds': round(elapsed, 2),
+        'peak_rss_bytes': peak_rss,
+        'endpoints': {kind: summarize_samples([s for s in samples if s[0] == kind], elapsed) for kind in kinds},
+    })
+    return summary
+
+# =============================================================================
+# SERVER
+# =============================================================================
+
+def free_port():
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def wait_for_server(base_url, process=None):
+    client = LoadClient(base_url, 0, distinct_addresses=False)
+    deadline = time.monotonic() + SERVER_START_TIMEOUT
+    while time.monotonic() < deadline:
+        if process is not None and process.poll() is not None:
+            raise RuntimeError(f"Server exited with code {process.returncode} before answering")
+        status, _ = client.request('GET', '/api/videos')
+        if status == 200:
+            return
+        time.sleep(0.2)
+    raise RuntimeError(f"Server at {base_url} did not answer within {SERVER_START_TIMEOUT}s")
+
+def start_server(command, admin_token):
+    """Start the server with its output silenced and the given admin token. Returns (process, base URL)."""
+    port = free_port()
+    env = dict(os.environ, PIXELATOR_LOG_LEVEL=os.environ.get("PIXELATOR_LOG_LEVEL", "ERROR"),
+               PIXELATOR_ADMIN_TOKEN=admin_token)
+    process = subprocess.Popen(shlex.split(command.format(port=port)), cwd=BACKEND_DIR, env=env,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    base_url = f"http://127.0.0.1:{port}"
+    try:
+        wait_for_server(base_url, process)
+    except Exception:
+        stop_server(process)
+        raise
+    return process, base_url
+
+def stop_server(process):
+    process.terminate()
+    try:
+        process.wait(timeout=10)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.wait()
+
+def remove_uploaded_animations(base_url, struct_names, admin_token=None):
+    """Delete what the upload scenarios published, through the admin API."""
+    client = LoadClient(base_url, 0, distinct_addresses=False)
+    headers = {'X-Admin-Token': admin_token} if admin_token else {}
+    for struct_name in sorted(struct_names):
+        client.request('DELETE', f'/api/admin/storage/{struct_name}', headers=headers)
+
+# =============================================================================
+# COMMAND LINE
+# =============================================================================
+
+def format_bytes(value):
+    return f"{value / (1024 * 1024):.0f} MB" if value is not None else "n/a"
+
+def print_summary(summary):
+    print(f"\n📊 {summary['scenario']} ({summary['seconds']:.1f}s, peak RSS {format_bytes(summary['peak_rss_bytes'])})")
+    rows = [('all', summary)] + list(summary['endpoints'].items())
+    for kind, figures in rows:
+        print(f"   {kind:<8} {figures['requests']:>6} req  {figures['throughput_rps']:>8.2f} req/s  "
+              f"p50 {figures['p50_ms'] or 0:>8.1f} ms  p95 {figures['p95_ms'] or 0:>8.1f} ms  "
+              f"p99 {figures['p99_ms'] or 0:>8.1f} ms  errors {figures['error_rate']:>6.1%}  "
+              f"rejected {figures['rejected_rate']:>6.1%}")
+
+def build_arg_parser():
+    parser = argparse.ArgumentParser(description="Run load scenarios against the pixelator web server.")
+    parser.add_argument('scenarios', nargs='*',
+                        help=f"Scenarios to run, in order (default: all of {', '.join(SCENARIOS)}).")
+    parser.add_argument('--duration', type=float, default=15.0, help="Seconds each scenario runs.")
+    parser.add_argument('--url', help="Target an already running server instead of starting one.")
+    parser.add_argument('--server-pid', type=int, help="Process id of the --url server, to measure its memory.")
+    parser.add_argument('--server-command', default=DEFAULT_SERVER_COMMAND,
+                        help="Command starting the server, run in the backend folder. {port} is replaced "
+                             "by a free port. Default: the threaded Flask development server.")
+    parser.add_argument('--admin-token', default=os.environ.get("PIXELATOR_ADMIN_TOKEN"),
+                        help="Admin token used to remove uploaded test animations afterwards. "
+                             "A server started by this script gets a random one unless this is set.")
+    parser.add_argument('--shared-address', action='store_true',
+                        help="Send all traffic from 127.0.0.1, so every client shares one per-client admission limit.")
+    parser.add_argument('--preview-clients', type=int, default=16, help="Users dragging preview sliders.")
+    parser.add_argument('--preview-debounce', type=float, default=0.15, help="Seconds between a user's preview requests.")
+    parser.add_argument('--upload-clients', type=int, default=4, help="Users uploading videos.")
+    parser.add_argument('--upload-think-time', type=float, default=1.0, help="Seconds between a user's uploads.")
+    parser.add_argument('--upload-fps', type=int, default=10, help="Frames per second uploads are sliced at.")
+    parser.add_argument('--poll-clients', type=int, default=8, help="Clients polling the video listing.")
+    parser.add_argument('--poll-interval', type=float, default=1.0, help="Seconds between a client's listing requests.")
+    parser.add_argument('--report', help="Write the results as JSON to this path.")
+    return parser
+
+def main(argv=None):
+    parser = build_arg_parser()
+    args = parser.parse_args(argv)
+    scenarios = args.scenarios or SCENARIOS
+    unknown = [name for name in scenarios if name not in SCENARIOS]
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(unknown)} (choose from {', '.join(SCENARIOS)})")
+
+    distinct_addresses = not args.shared_address and loopback_aliases_available()
+    if not args.shared_address and not distinct_addresses:
+        print("⚠️  Can't bind to 127.0.0.x aliases here; all clients share one address and per-client limits.")
+
+    with tempfile.TemporaryDirectory(prefix="pixelator_load_") as fixture_dir:
+        video_bytes = make_fixture_video(os.path.join(fixture_dir, "loadtest.mp4"))
+
+    process = None
+    if args.url:
+        base_url, server_pid = args.url.rstrip('/'), args.server_pid
+        wait_for_server(base_url)
+    else:
+        args.admin_token = args.admin_token or uuid.uuid4().hex
+        process, base_url = start_server(args.server_command, args.admin_token)
+        server_pid = process.pid
+    print(f"🚦 Load testing {base_url} for {args.duration:.0f}s per scenario: {', '.join(scenarios)}")
+
+    summaries = []
+    struct_names = set()
+    try:
+        for name in scenarios:
+            summary, uploaded = run_scenario(name, base_url, args, video_bytes, server_pid, distinct_addresses)
+            struct_names |= uploaded
+            summaries.append(summary)
+            print_summary(summary)
+    finally:
+        remove_uploaded_animations(base_url, struct_names, args.admin_token)
+        if process is not None:
+            stop_server(process)
+
+    if args.report:
+        with open(args.report, 'w') as f:
+            json.dump({'url': base_url, 'duration': args.duration, 'scenarios': summaries}, f, indent=2)
+        print(f"📝 Report written to {args.report}")
+
+    return 1 if any(summary['error_rate'] > 0 for summary in summaries) else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -2,13 +2,24 @@
 
 import sys
 import os
+import logging
 from PIL import Image
 import re
 import math
 import cv2
 import shutil
 import subprocess
+import queue
+import threading
+import numpy as np
 import io # <-- Add this import for in-memory image handling
+import json
+import numbers
+import tempfile
+from workspace import Workspace, use_workspace, locked_file, get_workspace_root
+from artifact_store import get_artifact_store, strip_declarations
+
+logger = logging.getLogger(__name__)
 
 # =============================================================================
 # --- SETTINGS ---
@@ -18,6 +29,8 @@ GRID_WIDTH = 18
 GRID_HEIGHT = 11
 CELL_WIDTH = 50 # Affects the output image size, not the data.
 CELL_ASPECT_RATIO = 1.6 # Height/Width ratio for each cell (configurable aspect ratio)
+MAX_GRID_DIMENSION = 128 # Largest grid width or height accepted
+MAX_CANVAS_PIXELS = 80_000_000 # Largest full-scale canvas (grid size x CELL_WIDTH x aspect ratio) rendered in memory
 
 SIGMOID_K = 0.042
 SIGMOID_CENTER = 175.0
@@ -26,6 +39,17 @@ ENHANCE_CONTRAST = True
 FILTER_THRESHOLD = 5  # Less aggressive - was 10
 DIMMING_THRESHOLD = 15  # Less aggressive - was 30
 
+VIDEO_DECODE_BACKEND = "auto" # "auto" uses ffmpeg when available, "ffmpeg" or "opencv" force one
+INGEST_CELL_WIDTH = 8 # Pixels per grid cell in the small grayscale frames ffmpeg decodes to
+VIDEO_DECODE_SHARDS = 1 # Worker processes the OpenCV backend splits a video's duration across
+PIPELINE_QUEUE_SIZE = 8 # Frames buffered between pipeline stages; bounds memory regardless of clip length
+MAX_REPORTED_VIOLATIONS = 20 # Out-of-range pixels listed individually in a validation report
+
+C_ENCODINGS = ('dense', 'sparse')
+C_ENCODING = "dense" # Encoding of generated C files; a flash budget picks the cheapest one instead
+FLASH_BUDGET_BYTES = None # Default byte budget for an animation's C data, None for no limit
+SPARSE_FRAME_BYTES = 8 # sizeof(animation_sparse_frame)
+
 # =============================================================================
 # UTILITY FUNCTIONS
 # =============================================================================
@@ -54,10 +78,11 @@ def get_processing_settings(custom_settings=None):
 # =============================================================================
 # FFMPEG AND VIDEO CONVERSION
 # =============================================================================
-def check_ffmpeg():
+def check_ffmpeg(verbose=True):
     if shutil.which("ffmpeg") is None:
-        print("❌ Error: ffmpeg is not installed or not in your PATH.")
-        print("Please install ffmpeg to convert .mov files. On macOS, you can use Homebrew: brew install ffmpeg")
+        if verbose:
+            logger.error("❌ ffmpeg is not installed or not in your PATH.")
+            logger.error("Please install ffmpeg to convert .mov files. On macOS, you can use Homebrew: brew install ffmpeg")
         return False
     return True
 
@@ -66,7 +91,7 @@ def convert_mov_to_mp4(mov_path):
         return None
 
     mp4_path = os.path.splitext(mov_path)[0] + ".mp4"
-    print(f"🔄 Found .mov file. Converting to '{os.path.basename(mp4_path)}'...")
+    logger.info("🔄 Found .mov file. Converting to '%s'...", os.path.basename(mp4_path))
     
     try:
         subprocess.run(
@@ -76,33 +101,48 @@ def convert_mov_to_mp4(mov_path):
             text=True,
             creationflags=subprocess.CREATE_NO_WINDOW if os.name == 'nt' else 0 # Hides the console window on Windows
         )
-        print("✅ Conversion successful!")
+        logger.info("✅ Conversion successful!")
         return mp4_path
     except FileNotFoundError:
-        print("❌ Error: ffmpeg command not found.")
+        logger.error("❌ ffmpeg command not found.")
         return None
     except subprocess.CalledProcessError as e:
-        print(f"❌ Error during ffmpeg conversion:")
-        print(e.stderr)
+        logger.error("❌ Error during ffmpeg conversion:\n%s", e.stderr)
         return None
 
 # ===============================================
 # SLICE IMAGE FUNCTION FROM MP4 VIDEOS
 # ===============================================
-def slice_video_to_frames(video_path, output_folder, frames_per_second=30):
+def slice_video_to_frames(video_path, output_folder, frames_per_second=30, settings=None, shards=None):
+    """
+    Extract frames from a video as numbered PNGs.
+    When processing settings are given (a dict, or a list of dicts when the frames
+    feed several grids) and ffmpeg is available, frames are decoded straight to small
+    grayscale images by ffmpeg. Otherwise (or when the grids differ in aspect ratio)
+    full-resolution frames are read with OpenCV, split across `shards` processes.
+    """
+    if settings and use_ffmpeg_decoder():
+        ingest_size = get_ingest_size(settings if isinstance(settings, list) else [settings])
+        if ingest_size:
+            return slice_video_to_gray_frames_ffmpeg(video_path, output_folder, frames_per_second, ingest_size)
+
+    shards = shards or VIDEO_DECODE_SHARDS
+    if shards > 1:
+        return slice_video_to_frames_sharded(video_path, output_folder, frames_per_second, shards)
+
     os.makedirs(output_folder, exist_ok=True)
 
     cap = cv2.VideoCapture(video_path)
     if not cap.isOpened():
-        print(f"Error: Could not open video file at '{video_path}'")
+        logger.error("Could not open video file at '%s'", video_path)
         return
 
     original_fps = cap.get(cv2.CAP_PROP_FPS)
     total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
     duration_in_seconds = total_frames / original_fps
 
-    print(f"Video Info: {original_fps:.2f} FPS, {total_frames} total frames, {duration_in_seconds:.2f}s duration.")
-    print(f"Slicing video to {frames_per_second} frames per second...")
+    logger.info("Video Info: %.2f FPS, %d total frames, %.2fs duration.", original_fps, total_frames, duration_in_seconds)
+    logger.info("Slicing video to %s frames per second...", frames_per_second)
 
     num_output_frames = int(duration_in_seconds * frames_per_second)
     saved_frame_count = 0
@@ -122,92 +162,272 @@ def slice_video_to_frames(video_path, output_folder, frames_per_second=30):
             cv2.imwrite(output_filename, frame)
             saved_frame_count += 1
         else:
-            print(f"Warning: Could not read frame at index {source_frame_index}. Stopping.")
+            logger.warning("Could not read frame at index %d. Stopping.", source_frame_index)
             break
             
     cap.release()
-    print(f"✅ Success! Extracted {saved_frame_count} frames to '{output_folder}'.")
+    logger.info("✅ Success! Extracted %d frames to '%s'.", saved_frame_count, output_folder)
+
+def use_ffmpeg_decoder():
+    """Whether videos are decoded by ffmpeg rather than OpenCV."""
+    return VIDEO_DECODE_BACKEND == "ffmpeg" or (VIDEO_DECODE_BACKEND == "auto" and check_ffmpeg(verbose=False))
+
+def get_source_frame_index(output_index, frames_per_second, original_fps):
+    """The source frame slice_video_to_frames samples for an output frame."""
+    return round(output_index / frames_per_second * original_fps)
+
+def iter_video_frames_opencv(video_path, frames_per_second, first_output=0, end_output=None):
+    """
+    Yield (output_index, BGR frame) for the frames slice_video_to_frames samples.
+    Seeks once to the first wanted frame (OpenCV decodes forward from the nearest
+    keyframe) and then reads sequentially instead of seeking for every frame.
+    """
+    cap = cv2.VideoCapture(video_path)
+    if not cap.isOpened():
+        logger.error("Could not open video file at '%s'", video_path)
+        return
+    original_fps = cap.get(cv2.CAP_PROP_FPS)
+    total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    if end_output is None:
+        end_output = int(total_frames / original_fps * frames_per_second)
+
+    position = get_source_frame_index(first_output, frames_per_second, original_fps)
+    cap.set(cv2.CAP_PROP_POS_FRAMES, position)
+    last_source_index = None
+    frame = None
+
+    try:
+        for i in range(first_output, end_output):
+            source_frame_index = get_source_frame_index(i, frames_per_second, original_fps)
+            if source_frame_index >= total_frames:
+                break
+
+            # Output fps above the source fps samples the same source frame more than once
+            if source_frame_index != last_source_index:
+                while position < source_frame_index:
+                    if not cap.grab():
+                        break
+                    position += 1
+                ret, frame = cap.read()
+                position += 1
+                if not ret or position <= source_frame_index:
+                    break
+                last_source_index = source_frame_index
+
+            yield i, frame
+    finally:
+        cap.release()
+
+def slice_video_shard(shard):
+    """
+    Decode one time segment of a video in a worker process, writing each sampled
+    frame under its global output index so the shards merge back in order.
+    """
+    video_path, output_folder, frames_per_second, first_output, end_output = shard
+
+    saved_frame_count = 0
+    for i, frame in iter_video_frames_opencv(video_path, frames_per_second, first_output, end_output):
+        cv2.imwrite(os.path.join(output_folder, f"frame_{i:05d}.png"), frame)
+        saved_frame_count += 1
+    return saved_frame_count
+
+def slice_video_to_frames_sharded(video_path, output_folder, frames_per_second, shards):
+    """
+    Split the video's duration into segments decoded in parallel worker processes.
+    Produces the same frame files, in the same order, as the sequential OpenCV path.
+    """
+    from concurrent.futures import ProcessPoolExecutor
+
+    os.makedirs(output_folder, exist_ok=True)
+
+    cap = cv2.VideoCapture(video_path)
+    if not cap.isOpened():
+        logger.error("Could not open video file at '%s'", video_path)
+        return
+    original_fps = cap.get(cv2.CAP_PROP_FPS)
+    total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    cap.release()
+    duration_in_seconds = total_frames / original_fps
+
+    logger.info("Video Info: %.2f FPS, %d total frames, %.2fs duration.", original_fps, total_frames, duration_in_seconds)
+    logger.info("Slicing video to %s frames per second in %d parallel segments...", frames_per_second, shards)
+
+    num_output_frames = int(duration_in_seconds * frames_per_second)
+    shards = max(1, min(shards, num_output_frames))
+    bounds = [num_output_frames * n // shards for n in range(shards + 1)]
+    segments = [(video_path, output_folder, frames_per_second, bounds[n], bounds[n + 1]) for n in range(shards)]
+
+    with ProcessPoolExecutor(max_workers=shards) as executor:
+        list(executor.map(slice_video_shard, segments))
+
+    # The sequential path stops at the first unreadable frame; drop anything a later segment decoded past it
+    saved_frame_count = 0
+    while os.path.exists(os.path.join(output_folder, f"frame_{saved_frame_count:05d}.png")):
+        saved_frame_count += 1
+    for i in range(saved_frame_count + 1, num_output_frames):
+        stray_frame = os.path.join(output_folder, f"frame_{i:05d}.png")
+        if os.path.exists(stray_frame):
+            os.remove(stray_frame)
+    expected_frame_count = sum(1 for i in range(num_output_frames)
+                               if get_source_frame_index(i, frames_per_second, original_fps) < total_frames)
+    if saved_frame_count < expected_frame_count:
+        logger.warning("Could not read frame %d. Stopping.", saved_frame_count)
+
+    logger.info("✅ Success! Extracted %d frames to '%s'.", saved_frame_count, output_folder)
+
+def get_ingest_size(settings_list):
+    """
+    Size of the intermediate grayscale frames ffmpeg decodes to, matching the canvas aspect
+    ratio of the grids. Returns None when the grids have different aspect ratios, since one
+    center crop can't serve them all.
+    """
+    sizes = []
+    for settings in settings_list:
+        settings = get_processing_settings(settings)
+        cell_height = int(CELL_WIDTH * settings['cell_aspect_ratio'])
+        canvas_width = settings['grid_width'] * CELL_WIDTH
+        canvas_height = settings['grid_height'] * cell_height
+        width = settings['grid_width'] * INGEST_CELL_WIDTH
+        sizes.append((canvas_width / canvas_height, width, round(width * canvas_height / canvas_width)))
+
+    if len({aspect for aspect, _, _ in sizes}) > 1:
+        return None
+    _, width, height = max(sizes, key=lambda size: size[1])
+    return width, height
+
+def read_process_log(log_file):
+    """Read and close the temporary file a subprocess wrote its stderr to."""
+    with log_file:
+        log_file.seek(0)
+        return log_file.read().decode(errors='replace')
+
+def iter_video_gray_frames_ffmpeg(video_path, frames_per_second, ingest_size):
+    """
+    Run one multi-threaded ffmpeg process that samples the video at the target fps, scales
+    and center-crops it to the ingest size and converts it to gray, yielding each frame as
+    an 'L' image. Raw frames are read from ffmpeg's stdout into one preallocated buffer.
+    """
+    width, height = ingest_size
+    # Scale to cover the canvas and crop the overflow, like Pixelator.process does
+    filters = [
+        f"fps={frames_per_second}",
+        f"scale={width}:{height}:force_original_aspect_ratio=increase",
+        f"crop={width}:{height}",
+        "format=gray",
+    ]
+    command = [
+        "ffmpeg", "-nostdin", "-loglevel", "error", "-threads", "0",
+        "-i", video_path, "-an", "-vf", ",".join(filters),
+        "-f", "rawvideo", "-pix_fmt", "gray", "-",
+    ]
+    # stderr goes to a file: an unread pipe would block ffmpeg once its buffer is full
+    stderr_file = tempfile.TemporaryFile()
+    process = subprocess.Popen(
+        command,
+        stdout=subprocess.PIPE,
+        stderr=stderr_file,
+        creationflags=subprocess.CREATE_NO_WINDOW if os.name == 'nt' else 0
+    )
+
+    frame_size = width * height
+    buffer = bytearray(frame_size)
+    view = memoryview(buffer)
+    try:
+        while True:
+            filled = 0
+            while filled < frame_size:
+                read = process.stdout.readinto(view[filled:])
+                if not read:
+                    break
+                filled += read
+            if filled < frame_size:
+                break
+            yield Image.frombytes('L', (width, height), buffer)
+    finally:
+        process.stdout.close()
+        if process.poll() is None:
+            # The consumer stopped early
+            process.kill()
+        process.wait()
+        stderr = read_process_log(stderr_file)
+        if process.returncode > 0:
+            logger.error("❌ Error during ffmpeg decoding:\n%s", stderr)
+
+def slice_video_to_gray_frames_ffmpeg(video_path, output_folder, frames_per_second, ingest_size):
+    """ffmpeg ingest backend for slice_video_to_frames: writes small grayscale frames."""
+    os.makedirs(output_folder, exist_ok=True)
+    logger.info("Slicing video to %s frames per second with ffmpeg (grayscale %dx%d)...", frames_per_second, ingest_size[0], ingest_size[1])
+
+    saved_frame_count = 0
+    for frame in iter_video_gray_frames_ffmpeg(video_path, frames_per_second, ingest_size):
+        frame.save(os.path.join(output_folder, f"frame_{saved_frame_count:05d}.png"), compress_level=1)
+        saved_frame_count += 1
+
+    logger.info("✅ Success! Extracted %d frames to '%s'.", saved_frame_count, output_folder)
 
 # ===============================================
 # IMAGE PROCESSING FUNCTIONS
 # ===============================================
 
-def apply_filtering(image, settings):
-    """Apply dark pixel filtering to an image."""
-    filtered_image = image.copy()
-    grid_width = settings['grid_width']
-    grid_height = settings['grid_height']
+def build_filter_table(settings):
+    """Brightness lookup table of the dark pixel filter: 0-255 in, filtered brightness out."""
     threshold = settings['filter_threshold']
     dimming_threshold = settings['dimming_threshold']
-    
-    pixels_changed = 0
-    for y in range(grid_height):
-        for x in range(grid_width):
-            brightness = filtered_image.getpixel((x, y))
-            if not isinstance(brightness, int) or brightness == 0:
-                continue
-                
-            original_brightness = brightness
-            
-            if brightness <= threshold:
-                # Set very dark pixels to black
-                new_brightness = 0
-            elif threshold < brightness <= dimming_threshold:
-                # Gentle linear dimming instead of aggressive quadratic
-                # Reduce brightness by 30% in the dimming range
-                new_brightness = validate_brightness(brightness * 0.7)
-            else:
-                new_brightness = brightness
-            
-            if new_brightness != original_brightness:
-                pixels_changed += 1
-                filtered_image.putpixel((x, y), new_brightness)
-    
-    return filtered_image, pixels_changed
+    table = []
+    for brightness in range(256):
+        if brightness <= threshold:
+            # Set very dark pixels to black
+            table.append(0)
+        elif brightness <= dimming_threshold:
+            # Gentle linear dimming instead of aggressive quadratic
+            # Reduce brightness by 30% in the dimming range
+            table.append(validate_brightness(brightness * 0.7))
+        else:
+            table.append(brightness)
+    return table
 
-def apply_contrast_enhancement(image, settings):
-    """Apply sigmoid contrast enhancement to an image."""
+def build_contrast_table(settings):
+    """Brightness lookup table of the sigmoid contrast curve, or None when contrast enhancement is off."""
     if not settings['enhance_contrast']:
-        return image, 0
-    
-    enhanced_image = image.copy()
-    grid_width = settings['grid_width']
-    grid_height = settings['grid_height']
+        return None
     k = settings['sigmoid_k']
     center = settings['sigmoid_center']
-    
-    pixels_enhanced = 0
-    for y in range(grid_height):
-        for x in range(grid_width):
-            val = enhanced_image.getpixel((x, y))
-            x_f = float(val)
-            sigmoid = 1.0 / (1.0 + math.exp(-k * (x_f - center)))
-            new_val = validate_brightness(sigmoid * 255.0)
-            
-            if new_val != val:
-                pixels_enhanced += 1
-                enhanced_image.putpixel((x, y), new_val)
-    
-    return enhanced_image, pixels_enhanced
+    table = []
+    for brightness in range(256):
+        exponent = -k * (brightness - center)
+        sigmoid = 0.0 if exponent > 700 else 1.0 / (1.0 + math.exp(exponent))
+        table.append(validate_brightness(sigmoid * 255.0))
+    return table
+
+def apply_lookup_table(image, table):
+    """Map every pixel through a 256-entry table. Returns the new image and how many pixels changed."""
+    mapped_image = image.point(table)
+    pixels_changed = int(np.count_nonzero(np.asarray(mapped_image) != np.asarray(image)))
+    return mapped_image, pixels_changed
+
+def apply_filtering(image, settings):
+    """Apply dark pixel filtering to an image."""
+    return apply_lookup_table(image, build_filter_table(settings))
+
+def apply_contrast_enhancement(image, settings):
+    """Apply sigmoid contrast enhancement to an image."""
+    table = build_contrast_table(settings)
+    if table is None:
+        return image, 0
+    return apply_lookup_table(image, table)
 
 def get_pixel_stats(image, settings):
     """Get statistics about pixel values in an image."""
-    grid_width = settings['grid_width']
-    grid_height = settings['grid_height']
+    pixels = get_grid_array(image, settings)
     
-    pixels = []
-    for y in range(grid_height):
-        for x in range(grid_width):
-            pixels.append(image.getpixel((x, y)))
-    
-    if not pixels:
+    if pixels.size == 0:
         return {'min': 0, 'max': 0, 'avg': 0, 'count': 0}
     
     return {
-        'min': min(pixels),
-        'max': max(pixels),
-        'avg': sum(pixels) / len(pixels),
-        'count': len(pixels)
+        'min': int(pixels.min()),
+        'max': int(pixels.max()),
+        'avg': float(pixels.mean()),
+        'count': int(pixels.size)
     }
 
 def save_preview_image(image, path, settings, scale=10):
@@ -238,11 +458,9 @@ def save_enhanced_preview(enhanced_frame, output_dir, filename, settings=None):
     grid_height = settings.get('grid_height', GRID_HEIGHT)
     cell_aspect_ratio = settings.get('cell_aspect_ratio', CELL_ASPECT_RATIO)
     
-    print(f"💫 Saving enhanced preview for {filename} with contrast settings:")
-    print(f"   - Enhance contrast: {settings.get('enhance_contrast', True)}")
-    print(f"   - Sigmoid K: {settings.get('sigmoid_k', 0.042)}")
-    print(f"   - Sigmoid center: {settings.get('sigmoid_center', 175.0)}")
-    print(f"   - Cell aspect ratio: 1:{cell_aspect_ratio}")
+    logger.debug("💫 Saving enhanced preview for %s with contrast settings: enhance contrast %s, sigmoid K %s, sigmoid center %s, cell aspect ratio 1:%s",
+                  filename, settings.get('enhance_contrast', True), settings.get('sigmoid_k', 0.042),
+                  settings.get('sigmoid_center', 175.0), cell_aspect_ratio)
     
     # Scale up the enhanced frame to a reasonable preview size with correct aspect ratio
     preview_scale = 10
@@ -257,7 +475,7 @@ def save_enhanced_preview(enhanced_frame, output_dir, filename, settings=None):
     base_name = os.path.splitext(filename)[0]
     preview_path = os.path.join(output_dir, f"{base_name}_final_enhanced.png")
     preview_image.save(preview_path)
-    print(f"✨ Final enhanced preview saved: {preview_path}")
+    logger.debug("✨ Final enhanced preview saved: %s", preview_path)
 
 def generate_video(output_dir, struct_name, fps=10, settings=None):
     """Generate a video from the processed preview images."""
@@ -269,25 +487,21 @@ def generate_video(output_dir, struct_name, fps=10, settings=None):
                 preview_files.append(filename)
         
         if not preview_files:
-            print("⚠️  No processed images found for video generation")
-            print(f"   🔍 Searched for *.png files in {output_dir}")
-            # Debug: show what files are actually there
-            all_files = [f for f in os.listdir(output_dir) if f.endswith('.png')]
-            print(f"   📁 Found {len(all_files)} PNG files: {all_files[:5]}..." if len(all_files) > 5 else f"   📁 Found files: {all_files}")
+            logger.warning("⚠️  No processed images found for video generation in %s", output_dir)
             return None
         
         # Sort files by frame number
         preview_files.sort(key=extract_number)
         
         if len(preview_files) < 2:
-            print("⚠️  Need at least 2 frames to generate a video")
+            logger.warning("⚠️  Need at least 2 frames to generate a video")
             return None
         
         # Get video dimensions from first image
         first_image_path = os.path.join(output_dir, preview_files[0])
         first_image = cv2.imread(first_image_path)
         if first_image is None:
-            print(f"❌ Could not read first image: {first_image_path}")
+            logger.error("❌ Could not read first image: %s", first_image_path)
             return None
         
         height, width, layers = first_image.shape
@@ -298,10 +512,10 @@ def generate_video(output_dir, struct_name, fps=10, settings=None):
         video_writer = cv2.VideoWriter(video_path, fourcc, fps, (width, height))
         
         if not video_writer.isOpened():
-            print("❌ Could not create video writer")
+            logger.error("❌ Could not create video writer")
             return None
         
-        print(f"🎬 Generating video with {len(preview_files)} frames at {fps} FPS...")
+        logger.info("🎬 Generating video with %d frames at %s FPS...", len(preview_files), fps)
         
         # Add each frame to video
         for i, filename in enumerate(preview_files):
@@ -310,17 +524,15 @@ def generate_video(output_dir, struct_name, fps=10, settings=None):
             
             if frame is not None:
                 video_writer.write(frame)
-                if (i + 1) % 10 == 0:  # Progress update every 10 frames
-                    print(f"   📹 Added frame {i + 1}/{len(preview_files)}")
             else:
-                print(f"⚠️  Could not read frame: {image_path}")
+                logger.warning("⚠️  Could not read frame: %s", image_path)
         
         # Release video writer
         video_writer.release()
         
         # Verify video was created
         if os.path.exists(video_path) and os.path.getsize(video_path) > 0:
-            print(f"✅ Video successfully generated: {video_path}")
+            logger.info("✅ Video successfully generated: %s", video_path)
             
             # Convert to web-compatible H.264 format if ffmpeg is available
             if shutil.which("ffmpeg"):
@@ -332,7 +544,7 @@ def generate_video(output_dir, struct_name, fps=10, settings=None):
                     os.rename(video_path, temp_path)
                     
                     # Convert to H.264
-                    print("🔄 Converting to web-compatible H.264 format...")
+                    logger.info("🔄 Converting to web-compatible H.264 format...")
                     subprocess.run([
                         "ffmpeg", "-i", temp_path, "-c:v", "libx264", 
                         "-preset", "fast", "-crf", "23", "-pix_fmt", "yuv420p", 
@@ -341,91 +553,62 @@ def generate_video(output_dir, struct_name, fps=10, settings=None):
                     
                     # Remove temp file
                     os.remove(temp_path)
-                    print("✅ Video converted to web-compatible format")
+                    logger.info("✅ Video converted to web-compatible format")
                     
                 except subprocess.CalledProcessError as e:
-                    print(f"⚠️  H.264 conversion failed: {e.stderr}")
+                    logger.warning("⚠️  H.264 conversion failed: %s", e.stderr)
                     # Restore original if conversion failed
                     if os.path.exists(temp_path):
                         os.rename(temp_path, video_path)
                 except Exception as e:
-                    print(f"⚠️  Conversion error: {str(e)}")
+                    logger.warning("⚠️  Conversion error: %s", e)
                     # Restore original if conversion failed
                     if os.path.exists(temp_path):
                         os.rename(temp_path, video_path)
             else:
-                print("ℹ️  ffmpeg not available - video in basic MP4 format")
+                logger.info("ℹ️  ffmpeg not available - video in basic MP4 format")
             
             return video_path
         else:
-            print("❌ Video generation failed")
+            logger.error("❌ Video generation failed")
             return None
             
     except Exception as e:
-        print(f"❌ Error generating video: {str(e)}")
+        logger.exception("❌ Error generating video: %s", e)
         return None
 
-def process_single_image_to_grid(input_path, settings):
+def load_grayscale_image(input_path):
     """
-    Process a single image into a pixelated grid.
-    Returns the final processed image that matches what will be in the C struct.
+    Decode an image from disk and convert it to grayscale ('L').
+    Returns None if the image could not be opened.
     """
     try:
         original_img = Image.open(input_path)
+        return original_img.convert('L')
     except FileNotFoundError:
-        print(f"Error: The file '{input_path}' was not found.")
+        logger.error("The file '%s' was not found.", input_path)
         return None
     except Exception as e:
-        print(f"Error opening or processing image: {e}")
+        logger.error("Error opening or processing image: %s", e)
         return None
 
-    # Extract settings
-    grid_width = settings['grid_width']
-    grid_height = settings['grid_height']
-    cell_aspect_ratio = settings['cell_aspect_ratio']
-    
-    # Calculate canvas dimensions
-    cell_height = int(CELL_WIDTH * cell_aspect_ratio)
-    canvas_width = grid_width * CELL_WIDTH
-    canvas_height = grid_height * cell_height
-
-    # Create background and resize original image to fit
-    background = Image.new('L', (canvas_width, canvas_height), 0)
-    original_img = original_img.convert('L')
-    
-    original_width, original_height = original_img.size
-    scale_factor = max(canvas_width / original_width, canvas_height / original_height)
-    new_width = int(original_width * scale_factor)
-    new_height = int(original_height * scale_factor)
-    resized_img = original_img.resize((new_width, new_height), Image.Resampling.LANCZOS)
-
-    paste_x = (canvas_width - new_width) // 2
-    paste_y = (canvas_height - new_height) // 2
-    background.paste(resized_img, (paste_x, paste_y))
-
-    # Create the initial pixelated version
-    raw_pixelated = background.resize((grid_width, grid_height), Image.Resampling.LANCZOS)
-    
-    # Apply filtering
-    filtered_image, pixels_filtered = apply_filtering(raw_pixelated, settings)
-    
-    # Apply contrast enhancement
-    final_image, pixels_enhanced = apply_contrast_enhancement(filtered_image, settings)
-    
-    # Validate all pixel values are in valid range
-    stats = get_pixel_stats(final_image, settings)
-    if stats['min'] < 0 or stats['max'] > 255:
-        print(f"⚠️  WARNING: Pixel values out of range! Min: {stats['min']}, Max: {stats['max']}")
-    
-    return {
-        'raw': raw_pixelated,
-        'filtered': filtered_image, 
-        'final': final_image,
-        'stats': {
-            'pixels_filtered': pixels_filtered,
-            'pixels_enhanced': pixels_enhanced
-        }
-    }
+def process_single_image_to_grid(input_path, settings):
+    """
+    Process a single image into a pixelated grid.
+    Returns the final processed image that matches what will be in the C struct.
+    """
+    original_img = load_grayscale_image(input_path)
+    if original_img is None:
+        return None
+
+    return process_grayscale_image_to_grid(original_img, settings)
+
+def process_grayscale_image_to_grid(original_img, settings):
+    """
+    Pixelate an already decoded grayscale image into the configured grid.
+    Lets one decoded frame be fanned out to several grid settings.
+    """
+    return Pixelator(settings).process(original_img)
 
 def process_image(input_path, output_path, return_pixelated=False, settings=None):
     """Main image processing function - now uses the refactored pipeline."""
@@ -435,181 +618,985 @@ def process_image(input_path, output_path, return_pixelated=False, settings=None
     if not result:
         return None
     
-    raw_pixelated = result['raw']
     final_image = result['final']
-    
-    # Save preview images
-    base_name = os.path.splitext(output_path)[0]
-    
-    # Save the full-scale final image
-    cell_height = int(CELL_WIDTH * settings['cell_aspect_ratio'])
-    canvas_width = settings['grid_width'] * CELL_WIDTH
-    canvas_height = settings['grid_height'] * cell_height
-    full_scale_final = final_image.resize((canvas_width, canvas_height), Image.Resampling.NEAREST)
+    save_full_scale_image(final_image, output_path, settings)
+
+    return final_image if return_pixelated else None
+
+def save_full_scale_image(final_image, output_path, settings):
+    """Save a processed grid scaled back up to the full canvas size."""
+    full_scale_final = scale_to_canvas(final_image, settings)
     
     os.makedirs(os.path.dirname(output_path), exist_ok=True)
     full_scale_final.save(output_path)
+    return full_scale_final
 
-    return final_image if return_pixelated else None
+def scale_to_canvas(final_image, settings):
+    """Scale a processed grid back up to the full canvas size."""
+    cell_height = int(CELL_WIDTH * settings['cell_aspect_ratio'])
+    canvas_width = settings['grid_width'] * CELL_WIDTH
+    canvas_height = settings['grid_height'] * cell_height
+    return final_image.resize((canvas_width, canvas_height), Image.Resampling.NEAREST)
 # --- (Keep all existing C Code Generation functions as they are) ---
 # ... from line 416 to line 498 ...
-def validate_c_struct_data(frame_data_list, settings):
-    """Validate that all pixel data is suitable for C struct generation."""
+def get_grid_array(enhanced_frame, settings):
+    """The grid of a processed frame as a (grid_height, grid_width) array of brightness values."""
+    pixels = np.asarray(enhanced_frame)
+    return pixels[:settings['grid_height'], :settings['grid_width']]
+
+def validate_c_struct_data(frames, settings):
+    """
+    Validate that all pixel data is suitable for C struct generation.
+    Frames may be processed images or grid arrays; the whole animation is checked
+    in one pass and a report is returned instead of logging every frame.
+    """
     grid_width = settings['grid_width']
     grid_height = settings['grid_height']
-    total_pixels = grid_width * grid_height
-    
-    print(f"🔍 Validating C struct data for {len(frame_data_list)} frames...")
-    
-    for frame_idx, (enhanced_frame, frame_number) in enumerate(frame_data_list):
-        pixels_out_of_range = 0
-        active_pixels = 0
-        
-        for y in range(grid_height):
-            for x in range(grid_width):
-                brightness = enhanced_frame.getpixel((x, y))
-                
-                if not isinstance(brightness, int):
-                    print(f"⚠️  Frame {frame_idx}: Non-integer brightness at ({x},{y}): {brightness}")
-                
-                if brightness < 0 or brightness > 255:
-                    pixels_out_of_range += 1
-                    print(f"⚠️  Frame {frame_idx}: Brightness out of range at ({x},{y}): {brightness}")
-                
-                if brightness > 0:
-                    active_pixels += 1
-        
-        if pixels_out_of_range > 0:
-            print(f"❌ Frame {frame_idx}: {pixels_out_of_range} pixels out of valid range!")
-        
-        print(f"✅ Frame {frame_idx}: {active_pixels}/{total_pixels} active pixels, all in valid range")
+    grids = [get_grid_array(frame, settings) for frame in frames]
+    stack = np.stack(grids) if grids else np.zeros((0, grid_height, grid_width), dtype=np.uint8)
 
-def generate_c_struct_array(frame_data_list, c_output_path, struct_variable_name, settings):
-    """Generate C struct array with validation."""
-    settings = get_processing_settings(settings)
-    
-    # Validate data before generating C code
-    validate_c_struct_data(frame_data_list, settings)
-    
+    non_integer = 0
+    if not np.issubdtype(stack.dtype, np.integer):
+        non_integer = int(np.count_nonzero(stack != np.round(stack)))
+
+    out_of_range = (stack < 0) | (stack > 255)
+    violations = [
+        {'frame': int(f), 'x': int(x), 'y': int(y), 'brightness': stack[f, y, x].item()}
+        for f, y, x in np.argwhere(out_of_range)[:MAX_REPORTED_VIOLATIONS]
+    ]
+
+    active = stack > 0
+    active_pixels = active.sum(axis=(1, 2))
+    histogram = np.bincount(np.clip(stack[active], 0, 255).astype(np.int64), minlength=256)
+
+    report = {
+        'frames': len(grids),
+        'pixels_per_frame': grid_width * grid_height,
+        'non_integer_pixels': non_integer,
+        'out_of_range_pixels': int(out_of_range.sum()),
+        'range_violations': violations,
+        'active_pixels': active_pixels.tolist(),
+        'brightness_histogram': histogram.tolist(),
+    }
+    report['valid'] = report['non_integer_pixels'] == 0 and report['out_of_range_pixels'] == 0
+
+    if not report['valid']:
+        logger.warning("❌ %d pixels out of valid range and %d non-integer pixels in %d frames (first: %s)",
+                       report['out_of_range_pixels'], non_integer, report['frames'], violations[:1])
+    elif report['frames']:
+        logger.info("✅ Validated %d frames: %d-%d of %d pixels active, all in valid range",
+                    report['frames'], active_pixels.min(), active_pixels.max(), report['pixels_per_frame'])
+    return report
+
+def generate_matrix_defines(settings):
+    """
+    Build the ANIMATION_MATRIX_* defines for a grid size.
+    Emitted ahead of the header include so a file can target a matrix other than the header default.
+    """
     grid_width = settings['grid_width']
     grid_height = settings['grid_height']
-    
+    return [
+        f'#define ANIMATION_MATRIX_WIDTH {grid_width}\n',
+        f'#define ANIMATION_MATRIX_HEIGHT {grid_height}\n',
+        f'#define ANIMATION_MAX_ACTIVE_PIXELS ({grid_width} * {grid_height})\n',
+    ]
+
+def is_default_grid(settings):
+    return (settings['grid_width'], settings['grid_height']) == (GRID_WIDTH, GRID_HEIGHT)
+
+def get_frame_type(settings):
+    """
+    C type of a dense frame. The shared animation_frame is sized for the default grid,
+    so every other grid gets its own typedef, e.g. animation_frame_32x16.
+    """
+    if is_default_grid(settings):
+        return 'animation_frame'
+    return f"animation_frame_{settings['grid_width']}x{settings['grid_height']}"
+
+def get_num_pixels_type(settings):
+    return 'uint8_t' if settings['grid_width'] * settings['grid_height'] <= 255 else 'uint16_t'
+
+def get_dense_frame_bytes(settings):
+    """sizeof() of one dense frame, including the padding before a uint16_t num_pixels."""
+    grid_pixels = settings['grid_width'] * settings['grid_height']
+    if get_num_pixels_type(settings) == 'uint8_t':
+        return grid_pixels + 2
+    return (grid_pixels + 2) // 2 * 2 + 2
+
+def generate_frame_typedef(settings):
+    """The typedef of a non-default grid's frame type, guarded so several headers can repeat it."""
+    frame_type = get_frame_type(settings)
+    guard = f"{frame_type.upper()}_DEFINED"
+    return [
+        f'#ifndef {guard}\n',
+        f'#define {guard}\n',
+        'typedef struct {\n',
+        f"    uint8_t brightness_levels[{settings['grid_width'] * settings['grid_height']}];\n",
+        '    uint8_t frame_number; // Index of this frame in an animation\n',
+        f'    {get_num_pixels_type(settings)} num_pixels;\n',
+        f'}} {frame_type};\n',
+        '#endif\n',
+    ]
+
+def generate_animation_header(struct_variable_name, declarations, settings, footprint):
+    """
+    The own header of an animation on a non-default grid: its frame typedef and extern
+    declarations, kept out of the shared header whose animation_frame has another size.
+    """
+    guard = f"{struct_variable_name.upper()}_H"
+    h_code = [
+        '// Generated by the pixelator script.\n',
+        f'#ifndef {guard}\n',
+        f'#define {guard}\n\n',
+        '#include "frames_as_c_code.h"\n\n',
+    ]
+    if footprint['encoding'] == 'dense':
+        h_code.extend(generate_frame_typedef(settings))
+        h_code.append('\n')
+    h_code.extend(declarations)
+    h_code.append(f'\n#endif // {guard}\n')
+    return h_code
+
+def generate_c_struct_array(frame_data_list, c_output_path, struct_variable_name, settings, matrix_defines=False):
+    """Generate C struct array with validation. Returns the validation and footprint reports."""
+    settings = get_processing_settings(settings)
+    grids = [get_grid_array(frame, settings) for frame, _ in frame_data_list]
+    frame_numbers = [frame_number for _, frame_number in frame_data_list]
+    return emit_c_animation(grids, frame_numbers, c_output_path, struct_variable_name, settings, matrix_defines)
+
+def emit_c_animation(grids, frame_numbers, c_output_path, struct_variable_name, settings, matrix_defines=False):
+    """
+    Render an animation's C file and write it, with its extern declarations: in its own header
+    next to the C file for a non-default grid, otherwise in a declarations file that
+    publish_animation moves into the shared header once the C file is published.
+    The footprint report is also saved next to the C file (see load_footprint_report).
+    """
+    rendered = render_c_animation(grids, frame_numbers, struct_variable_name, settings, matrix_defines)
+    footprint = rendered['footprint']
+
+    os.makedirs(os.path.dirname(c_output_path), exist_ok=True)
+    with open(c_output_path, 'w') as c_file:
+        c_file.write(rendered['c_code'])
+    with open(get_footprint_report_path(c_output_path), 'w') as f:
+        json.dump(footprint, f, indent=2)
+    logger.info("✅ C struct array saved to '%s' (%s encoding, %d bytes)",
+                c_output_path, footprint['encoding'], footprint['bytes'])
+    logger.debug("🔗 The C struct contains the same data as the main .png images")
+
+    if rendered['header'] is None:
+        with open(get_declarations_path(c_output_path), 'w') as f:
+            f.write("".join(rendered['declarations']))
+    else:
+        with open(get_animation_header_path(c_output_path), 'w') as h_file:
+            h_file.write(rendered['header'])
+    return {'validation': rendered['validation'], 'footprint': footprint}
+
+def render_c_animation(grids, frame_numbers, struct_variable_name, settings, matrix_defines=False):
+    """
+    Validate the grids of an animation, pick its encoding and render the C source in memory.
+    Returns the C code, its extern declarations, its own header (None on the default grid,
+    whose declarations belong in the shared header) and the validation and footprint reports.
+    """
+    # Other grids need their own ANIMATION_PIXEL_INDEX, whatever the caller asked for
+    own_header = not is_default_grid(settings)
+    matrix_defines = matrix_defines or own_header
+
+    # Validate data before generating C code
+    validation = validate_c_struct_data(grids, settings)
+    footprint = plan_encoding(grids, settings)
+    selected = range(0, len(grids), footprint['frame_step'])
+
+    if footprint['encoding'] == 'sparse':
+        c_code = generate_sparse_c_code([grids[i] for i in selected], [frame_numbers[i] for i in selected],
+                                        struct_variable_name, settings, matrix_defines)
+    else:
+        c_code = generate_c_file_header(struct_variable_name, len(selected), settings, matrix_defines)
+        for i in selected:
+            c_code.extend(generate_c_frame_block(grids[i], frame_numbers[i], settings))
+        c_code.append('};\n')
+
+    declarations = get_extern_declarations(struct_variable_name, footprint, settings)
+    header = generate_animation_header(struct_variable_name, declarations, settings, footprint) if own_header else None
+    return {
+        'c_code': "".join(c_code),
+        'declarations': declarations,
+        'header': "".join(header) if header else None,
+        'validation': validation,
+        'footprint': footprint,
+    }
+
+def generate_c_file_preamble(struct_variable_name, settings, matrix_defines=False):
+    """
+    The comment, optional matrix defines and header include every generated C file starts with.
+    Animations on a non-default grid include their own header instead of the shared one.
+    """
     c_code = [
         '// Generated by the pixelator script.\n',
         f'// This C struct contains the processed pixel data from the main .png images.\n',
-        '#include "frames_as_c_code.h"\n\n',
-        f'const animation_frame {struct_variable_name}[{len(frame_data_list)}] = {{\n'
     ]
+    if matrix_defines:
+        c_code.extend(generate_matrix_defines(settings))
+    header_name = "frames_as_c_code" if is_default_grid(settings) else struct_variable_name
+    c_code.append(f'#include "{header_name}.h"\n\n')
+    return c_code
+
+def generate_c_file_header(struct_variable_name, frame_count, settings, matrix_defines=False):
+    """The lines of a generated C file up to the opening of the frame array."""
+    c_code = generate_c_file_preamble(struct_variable_name, settings, matrix_defines)
+    c_code.append(f'const {get_frame_type(settings)} {struct_variable_name}[{frame_count}] = {{\n')
+    return c_code
+
+def generate_c_frame_block(enhanced_frame, frame_number, settings):
+    """The C initializer lines of one animation_frame."""
+    grid = np.clip(get_grid_array(enhanced_frame, settings), 0, 255).astype(np.int64)
+    # Row-major, so pixels are listed in the same order as ANIMATION_PIXEL_INDEX
+    ys, xs = np.nonzero(grid > 0)
+    pixels = [{'x': x, 'y': y, 'brightness': b} for y, x, b in zip(ys.tolist(), xs.tolist(), grid[ys, xs].tolist())]
+
+    c_code = [
+        '    {\n',
+        f'        .frame_number = {frame_number},\n',
+        f'        .num_pixels = {len(pixels)},\n',
+        '        .brightness_levels = {\n'
+    ]
+
+    for p in pixels:
+        c_code.append(f'            [ANIMATION_PIXEL_INDEX({p["y"]}, {p["x"]})] = {p["brightness"]},\n')
 
-    for enhanced_frame, frame_number in frame_data_list:
-        pixels = []
-        for y in range(grid_height):
-            for x in range(grid_width):
-                brightness = enhanced_frame.getpixel((x, y))
-                # Ensure brightness is valid and integer
-                brightness = validate_brightness(brightness)
-                if brightness > 0:
-                    pixels.append({'x': x, 'y': y, 'brightness': brightness})
-
-        c_code.extend([
-            '    {\n',
-            f'        .frame_number = {frame_number},\n',
-            f'        .num_pixels = {len(pixels)},\n',
-            '        .brightness_levels = {\n'
-        ])
-
-        for p in pixels:
-            c_code.append(f'            [ANIMATION_PIXEL_INDEX({p["y"]}, {p["x"]})] = {p["brightness"]},\n')
-
-        c_code.extend(['        },\n', '    },\n'])
+    c_code.extend(['        },\n', '    },\n'])
+    return c_code
+
+def generate_sparse_c_code(grids, frame_numbers, struct_variable_name, settings, matrix_defines=False):
+    """
+    The C source of an animation in the sparse encoding: the lit pixels of all frames
+    in two shared arrays (pixel index and brightness) and one animation_sparse_frame per
+    frame pointing at its slice of them.
+    """
+    index_type = get_sparse_index_type(settings)
+    index_lines, level_lines, frame_lines = [], [], []
+    first_pixel = 0
+    for grid, frame_number in zip(grids, frame_numbers):
+        flat = np.clip(grid, 0, 255).astype(np.int64).ravel()
+        # Row-major flat positions are exactly ANIMATION_PIXEL_INDEX(y, x)
+        indices = np.flatnonzero(flat)
+        index_lines.append(f'    /* frame {frame_number} */ {"".join(f"{i}, " for i in indices.tolist())}\n')
+        level_lines.append(f'    /* frame {frame_number} */ {"".join(f"{b}, " for b in flat[indices].tolist())}\n')
+        frame_lines.append(f'    {{ .first_pixel = {first_pixel}, .num_pixels = {len(indices)}, .frame_number = {frame_number} }},\n')
+        first_pixel += len(indices)
+    # C doesn't allow empty arrays, so an all-dark animation keeps one unused entry
+    pixel_count = max(first_pixel, 1)
+
+    c_code = generate_c_file_preamble(struct_variable_name, settings, matrix_defines)
+    c_code.append(f'const {index_type} {struct_variable_name}_pixel_indices[{pixel_count}] = {{\n')
+    c_code.extend(index_lines if first_pixel else ['    0,\n'])
+    c_code.append('};\n\n')
+    c_code.append(f'const uint8_t {struct_variable_name}_brightness_levels[{pixel_count}] = {{\n')
+    c_code.extend(level_lines if first_pixel else ['    0,\n'])
+    c_code.append('};\n\n')
+    c_code.append(f'const animation_sparse_frame {struct_variable_name}[{len(grids)}] = {{\n')
+    c_code.extend(frame_lines)
     c_code.append('};\n')
+    return c_code
 
-    os.makedirs(os.path.dirname(c_output_path), exist_ok=True)
-    with open(c_output_path, 'w') as f:
-        f.write("".join(c_code))
-    print(f"✅ C struct array saved to '{c_output_path}'")
-    print("🔗 The C struct contains the same data as the main .png images")
+def get_extern_declarations(struct_variable_name, footprint, settings):
+    """The header declarations of a generated animation, depending on its encoding."""
+    if footprint['encoding'] == 'sparse':
+        pixel_count = max(footprint['active_pixels'], 1)
+        return [
+            f"extern const animation_sparse_frame {struct_variable_name}[{footprint['frames']}];\n",
+            f"extern const {get_sparse_index_type(settings)} {struct_variable_name}_pixel_indices[{pixel_count}];\n",
+            f"extern const uint8_t {struct_variable_name}_brightness_levels[{pixel_count}];\n",
+        ]
+    return [f"extern const {get_frame_type(settings)} {struct_variable_name}[{footprint['frames']}];\n"]
 
-    # Update header file
+def register_struct_declaration(struct_name, declarations):
+    """
+    Put the extern declarations of a generated animation in the shared header, replacing
+    any it had before (a re-upload may change its frame count or encoding).
+    """
     backend_dir = os.path.dirname(os.path.abspath(__file__))
     header_path = os.path.join(backend_dir, "frames_as_c_code.h")
-    declaration = f"extern const animation_frame {struct_variable_name}[{len(frame_data_list)}];\n"
+    # Concurrent requests may update the header at the same time
+    with locked_file(header_path):
+        try:
+            with open(header_path, 'r') as h_file:
+                header = h_file.read()
+        except FileNotFoundError:
+            header = ""
+
+        updated = strip_declarations(header, struct_name)
+        if updated and not updated.endswith("\n"):
+            updated += "\n"
+        updated += "".join(declarations)
+        if updated == header:
+            logger.debug("Declarations already in %s", header_path)
+            return
+        with open(header_path, 'w') as h_file:
+            h_file.write(updated)
+            logger.info("Updated the %d extern declarations of %s in %s", len(declarations), struct_name, header_path)
+
+# ===============================================
+# FLASH FOOTPRINT
+# ===============================================
+
+class FlashBudgetError(ValueError):
+    """Raised when a flash budget can't hold even a single frame. Passed on by the wrapper functions."""
+
+def get_sparse_index_type(settings):
+    """Smallest C type that holds every ANIMATION_PIXEL_INDEX of the grid."""
+    return 'uint8_t' if settings['grid_width'] * settings['grid_height'] <= 256 else 'uint16_t'
+
+def measure_footprint(active_pixels, settings):
+    """
+    Exact bytes of the const data each encoding emits for frames with the given lit pixel counts.
+      dense:  one frame struct per frame, a byte per grid pixel plus frame_number and num_pixels
+              (see get_dense_frame_bytes).
+      sparse: an 8-byte animation_sparse_frame per frame (uint32_t + 2 x uint16_t, no padding on any ABI),
+              plus an index and a brightness byte per lit pixel.
+    """
+    frame_count = len(active_pixels)
+    index_bytes = 1 if get_sparse_index_type(settings) == 'uint8_t' else 2
+    pixel_count = max(int(sum(active_pixels)), 1)
+    return {
+        'dense': frame_count * get_dense_frame_bytes(settings),
+        'sparse': frame_count * SPARSE_FRAME_BYTES + pixel_count * (index_bytes + 1),
+    }
+
+def plan_encoding(grids, settings):
+    """
+    Choose how an animation is emitted and report its flash footprint.
+    Without a budget the 'encoding' setting is used as is. With 'flash_budget_bytes' the cheapest
+    encoding that fits is picked, keeping only every n-th frame when no encoding fits all of them.
+    Raises FlashBudgetError when not even a single frame fits.
+    """
+    active_pixels = [int(np.count_nonzero(grid)) for grid in grids]
+    budget = settings.get('flash_budget_bytes', FLASH_BUDGET_BYTES) or None
+    encoding = settings.get('encoding', C_ENCODING)
+    if encoding not in C_ENCODINGS:
+        raise ValueError(f"Unknown encoding '{encoding}' (choose from {', '.join(C_ENCODINGS)})")
+
+    frame_step = 1
+    encodings = measure_footprint(active_pixels, settings)
+    if budget is not None:
+        while True:
+            encoding = min(encodings, key=encodings.get)
+            if encodings[encoding] <= budget:
+                break
+            if frame_step >= len(grids):
+                raise FlashBudgetError(f"Flash budget of {budget} bytes is too small: a single frame needs {encodings[encoding]} bytes")
+            frame_step += 1
+            encodings = measure_footprint(active_pixels[::frame_step], settings)
+
+    selected_pixels = active_pixels[::frame_step]
+    return {
+        'encoding': encoding,
+        'bytes': encodings[encoding],
+        'encodings': encodings,
+        'budget_bytes': budget,
+        'frame_step': frame_step,
+        'frames': len(selected_pixels),
+        'source_frames': len(grids),
+        'active_pixels': sum(selected_pixels),
+    }
+
+def get_footprint_report_path(c_output_path):
+    return os.path.splitext(c_output_path)[0] + ".footprint.json"
+
+def get_animation_header_path(c_output_path):
+    return os.path.splitext(c_output_path)[0] + ".h"
+
+def get_declarations_path(c_output_path):
+    """Where the shared-header declarations of an animation wait in its workspace until it is published."""
+    return os.path.splitext(c_output_path)[0] + ".declarations"
+
+def load_animation_header(workspace, struct_name):
+    """The own header of an animation generated in a workspace, or None if it is declared in the shared one."""
+    _, c_output_path = get_workspace_output_paths(workspace, struct_name)
     try:
-        with open(header_path, 'r') as h_file:
-            if declaration in h_file.read():
-                print(f"Declaration for {struct_variable_name} already in {header_path}")
-                return
+        with open(get_animation_header_path(c_output_path), 'r') as f:
+            return f.read()
     except FileNotFoundError:
-        pass
+        return None
 
-    with open(header_path, 'a') as h_file:
-        h_file.write(declaration)
-        print(f"Appended extern declaration for {struct_variable_name} to {header_path}")
+def load_footprint_report(workspace, struct_name):
+    """The footprint report of an animation generated in a workspace, or None."""
+    _, c_output_path = get_workspace_output_paths(workspace, struct_name)
+    try:
+        with open(get_footprint_report_path(c_output_path), 'r') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
 
 def extract_number(filename):
     match = re.search(r'(\d+)', filename)
     return int(match.group(1)) if match else -1
 
+# ===============================================
+# LIBRARY API
+# ===============================================
+
+C_IDENTIFIER_PATTERN = re.compile(r'^[A-Za-z_][A-Za-z0-9_]*$')
+
+def _check_number(settings, key, kind, minimum=None, maximum=None):
+    """Raise ValueError unless settings[key] is a number of the given kind (numbers.Integral or numbers.Real) in range."""
+    value = settings[key]
+    if isinstance(value, bool) or not isinstance(value, kind):
+        kind_name = 'an integer' if kind is numbers.Integral else 'a number'
+        raise ValueError(f"'{key}' must be {kind_name}, got {value!r}")
+    if not math.isfinite(value):
+        raise ValueError(f"'{key}' must be finite, got {value!r}")
+    if (minimum is not None and value < minimum) or (maximum is not None and value > maximum):
+        bounds = f"at least {minimum}" if maximum is None else f"from {minimum} to {maximum}"
+        raise ValueError(f"'{key}' must be {bounds}, got {value!r}")
+
+def validate_settings(custom_settings=None):
+    """Complete settings with defaults and check them. Raises ValueError on an invalid setting."""
+    settings = get_processing_settings(custom_settings)
+    for key in ('grid_width', 'grid_height'):
+        _check_number(settings, key, numbers.Integral, 1, MAX_GRID_DIMENSION)
+        settings[key] = int(settings[key])
+    for key in ('filter_threshold', 'dimming_threshold'):
+        _check_number(settings, key, numbers.Integral, 0, 255)
+    for key in ('sigmoid_k', 'sigmoid_center', 'cell_aspect_ratio'):
+        _check_number(settings, key, numbers.Real)
+    if not settings['cell_aspect_ratio'] > 0:
+        raise ValueError(f"'cell_aspect_ratio' must be positive, got {settings['cell_aspect_ratio']!r}")
+    canvas_pixels = settings['grid_width'] * CELL_WIDTH * settings['grid_height'] * int(CELL_WIDTH * settings['cell_aspect_ratio'])
+    if canvas_pixels > MAX_CANVAS_PIXELS:
+        raise ValueError(f"A {settings['grid_width']}x{settings['grid_height']} grid with cell aspect ratio "
+                         f"{settings['cell_aspect_ratio']} is too large to render")
+    for key in ('fps', 'video_fps'):
+        if key in settings:
+            _check_number(settings, key, numbers.Real)
+            if not settings[key] > 0:
+                raise ValueError(f"'{key}' must be positive, got {settings[key]!r}")
+    if settings.get('encoding', C_ENCODING) not in C_ENCODINGS:
+        raise ValueError(f"'encoding' must be one of {', '.join(C_ENCODINGS)}, got {settings['encoding']!r}")
+    if settings.get('flash_budget_bytes') is not None:
+        _check_number(settings, 'flash_budget_bytes', numbers.Integral, 0)
+    return settings
+
+class Pixelator:
+    """
+    In-process API without side effects: nothing is written next to this module, the
+    shared header and artifact store are left alone, and nothing is printed.
+    Images come in as bytes, file-like objects, paths, PIL images or numpy arrays;
+    grids, C source, PNGs and video come back in memory. Only video decoding from
+    bytes and video encoding use a private temporary file, removed straight away.
+
+        pixelator = Pixelator(grid_width=32, grid_height=16)
+        grid = pixelator.grid(png_bytes)
+        animation = pixelator.animate_video(mp4_bytes, "intro", video=True)
+        animation['c_code'], animation['footprint'], animation['video']
+    """
+
+    def __init__(self, settings=None, **overrides):
+        self.settings = validate_settings(dict(settings or {}, **overrides))
+        self.grid_size = (self.settings['grid_width'], self.settings['grid_height'])
+        cell_height = int(CELL_WIDTH * self.settings['cell_aspect_ratio'])
+        self.canvas_size = (self.settings['grid_width'] * CELL_WIDTH, self.settings['grid_height'] * cell_height)
+        # The filter and contrast curves only depend on the settings, so they are computed once
+        self.filter_table = build_filter_table(self.settings)
+        self.contrast_table = build_contrast_table(self.settings)
+
+    # --- Single images ---
+
+    def load(self, source):
+        """
+        Decode a source into a grayscale ('L') PIL image. Arrays must be uint8, shaped
+        (height, width) for grayscale or (height, width, 3 or 4) for RGB(A); other dtypes
+        are rejected rather than guessed at, so convert e.g. 0-1 floats with (a * 255).astype(np.uint8).
+        """
+        if isinstance(source, Image.Image):
+            image = source
+        elif isinstance(source, np.ndarray):
+            if source.dtype != np.uint8:
+                raise ValueError(f"Image arrays must be uint8, got {source.dtype}")
+            if not (source.ndim == 2 or (source.ndim == 3 and source.shape[2] in (3, 4))):
+                raise ValueError(f"Image arrays must be (height, width) or (height, width, 3 or 4), got {source.shape}")
+            image = Image.fromarray(np.ascontiguousarray(source))
+        elif isinstance(source, (bytes, bytearray, memoryview)):
+            image = Image.open(io.BytesIO(source))
+        else:
+            image = Image.open(source)  # Path or file-like object
+        return image if image.mode == 'L' else image.convert('L')
+
+    def process(self, source):
+        """
+        Pixelate an image into the grid. Returns the 'raw', 'filtered' and 'final'
+        grid images and how many pixels each step changed.
+        """
+        original_img = self.load(source)
+        canvas_width, canvas_height = self.canvas_size
+
+        # Scale to cover the canvas, centred, then average down to one pixel per cell
+        background = Image.new('L', self.canvas_size, 0)
+        original_width, original_height = original_img.size
+        scale_factor = max(canvas_width / original_width, canvas_height / original_height)
+        new_width = int(original_width * scale_factor)
+        new_height = int(original_height * scale_factor)
+        resized_img = original_img.resize((new_width, new_height), Image.Resampling.LANCZOS)
+        background.paste(resized_img, ((canvas_width - new_width) // 2, (canvas_height - new_height) // 2))
+        raw_pixelated = background.resize(self.grid_size, Image.Resampling.LANCZOS)
+
+        filtered_image, pixels_filtered = apply_lookup_table(raw_pixelated, self.filter_table)
+        if self.contrast_table is None:
+            final_image, pixels_enhanced = filtered_image, 0
+        else:
+            final_image, pixels_enhanced = apply_lookup_table(filtered_image, self.contrast_table)
+
+        return {
+            'raw': raw_pixelated,
+            'filtered': filtered_image,
+            'final': final_image,
+            'stats': {
+                'pixels_filtered': pixels_filtered,
+                'pixels_enhanced': pixels_enhanced
+            }
+        }
+
+    def grid(self, source):
+        """The brightness grid of an image as a (grid_height, grid_width) uint8 array."""
+        return get_grid_array(self.process(source)['final'], self.settings)
+
+    def canvas(self, grid):
+        """A grid scaled up to the full preview canvas, as a PIL image."""
+        return scale_to_canvas(Image.fromarray(np.asarray(grid, dtype=np.uint8)), self.settings)
+
+    def preview_png(self, source, scale=20):
+        """PNG bytes of an image's grid, enlarged for the live preview."""
+        preview_width = self.settings['grid_width'] * scale
+        preview_height = int(self.settings['grid_height'] * scale * self.settings['cell_aspect_ratio'])
+        # Resize using NEAREST to maintain the pixelated look
+        preview_image = self.process(source)['final'].resize((preview_width, preview_height), Image.Resampling.NEAREST)
+        png_io = io.BytesIO()
+        preview_image.save(png_io, 'PNG')
+        return png_io.getvalue()
+
+    # --- Animations ---
+
+    def c_source(self, grids, struct_name, frame_numbers=None, matrix_defines=False):
+        """
+        Render grids as a C animation. Returns the C code, the extern declarations it
+        needs in a header, its own header for a non-default grid ('header', else None),
+        and the validation and flash footprint reports.
+        """
+        if not C_IDENTIFIER_PATTERN.match(struct_name):
+            raise ValueError(f"'{struct_name}' is not a valid C identifier")
+        grids = [np.asarray(grid) for grid in grids]
+        if not grids:
+            raise ValueError("An animation needs at least one frame")
+        if frame_numbers is None:
+            frame_numbers = list(range(len(grids)))
+        return render_c_animation(grids, list(frame_numbers), struct_name, self.settings, matrix_defines)
+
+    def video_frames(self, video):
+        """Decode a video (path, bytes or file-like object) at the 'fps' setting. Yields grayscale frames."""
+        frames_per_second = self.settings.get('fps', 10)
+        if isinstance(video, (str, os.PathLike)):
+            for _, _, frame in iter_video_frames(os.fspath(video), frames_per_second, self.settings):
+                yield frame
+            return
+
+        data = video if isinstance(video, (bytes, bytearray, memoryview)) else video.read()
+        # OpenCV and ffmpeg need to seek in the container, so the clip goes to a private temporary file
+        with tempfile.TemporaryDirectory(dir=get_workspace_root()) as temp_dir:
+            video_path = os.path.join(temp_dir, "video.mp4")
+            with open(video_path, 'wb') as f:
+                f.write(data)
+            for _, _, frame in iter_video_frames(video_path, frames_per_second, self.settings):
+                yield frame
+
+    def encode_video(self, grids, fps=None):
+        """MP4 bytes of grids shown at preview scale, or None if encoding failed."""
+        fps = fps or self.settings.get('video_fps', 30)
+        with tempfile.TemporaryDirectory(dir=get_workspace_root()) as temp_dir:
+            video_path = os.path.join(temp_dir, "animation.mp4")
+            encoder = None
+            for grid in grids:
+                image = self.canvas(grid)
+                if encoder is None:
+                    encoder = StreamingVideoEncoder(video_path, fps, image.size)
+                encoder.write(image)
+            if encoder is None or encoder.close() is None:
+                return None
+            with open(video_path, 'rb') as f:
+                return f.read()
+
+    def animate(self, sources, struct_name, video=False):
+        """
+        Turn a sequence of images into an animation. Returns the grids, C source,
+        declarations, reports and, with video=True, the preview video bytes.
+        """
+        grids = [self.grid(source) for source in sources]
+        animation = self.c_source(grids, struct_name)
+        animation['grids'] = grids
+        animation['video'] = self.encode_video(grids) if video and len(grids) > 1 else None
+        return animation
+
+    def animate_video(self, source, struct_name, video=False):
+        """Like animate, for the frames of a video (path, bytes or file-like object) sampled at the 'fps' setting."""
+        return self.animate(self.video_frames(source), struct_name, video)
+
+# ===============================================
+# OUTPUT LOCATIONS
+# ===============================================
+
+def get_output_paths(struct_name):
+    """Shared paths of the C file and video published for a struct name."""
+    backend_dir = os.path.dirname(os.path.abspath(__file__))
+    c_output_path = os.path.join(backend_dir, "frames_as_c_code", f"{struct_name}.c")
+    video_path = os.path.join(backend_dir, "output_images", struct_name, f"{struct_name}_animation.mp4")
+    return c_output_path, video_path
+
+def get_workspace_output_paths(workspace, struct_name):
+    """Where an animation is built inside a request workspace before it is published."""
+    output_animation_dir = workspace.makedirs("output_images", struct_name)
+    c_output_path = workspace.path("frames_as_c_code", f"{struct_name}.c")
+    return output_animation_dir, c_output_path
+
+def publish_animation(workspace, struct_name, include_previews=True):
+    """Atomically move a finished animation from its workspace to the shared output folders."""
+    output_animation_dir, c_output_path = get_workspace_output_paths(workspace, struct_name)
+    final_c_output_path, final_video_path = get_output_paths(struct_name)
+    if include_previews:
+        workspace.publish_dir(output_animation_dir, os.path.dirname(final_video_path))
+    workspace.publish_file(c_output_path, final_c_output_path)
+
+    # The shared header only learns about the animation once its C file is in place
+    header_path = get_animation_header_path(c_output_path)
+    final_header_path = get_animation_header_path(final_c_output_path)
+    if os.path.exists(header_path):
+        workspace.publish_file(header_path, final_header_path)
+        # Declarations left in the shared header by an earlier default-grid run would now conflict
+        get_artifact_store().remove_declarations(struct_name)
+    else:
+        try:
+            os.remove(final_header_path)
+        except FileNotFoundError:
+            pass
+        with open(get_declarations_path(c_output_path), 'r') as f:
+            register_struct_declaration(struct_name, f.read().splitlines(keepends=True))
+    get_artifact_store().record(struct_name)
+    return final_c_output_path, os.path.dirname(final_video_path)
+
+# ===============================================
+# STREAMING PIPELINE
+# ===============================================
+
+_PIPELINE_END = object()
+
+def _pipeline_put(stage_queue, item, stop_event):
+    """Blocking put that gives up once another stage has failed."""
+    while not stop_event.is_set():
+        try:
+            stage_queue.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+def _pipeline_get(stage_queue, stop_event):
+    """Blocking get that returns _PIPELINE_END once another stage has failed."""
+    while not stop_event.is_set():
+        try:
+            return stage_queue.get(timeout=0.1)
+        except queue.Empty:
+            continue
+    return _PIPELINE_END
+
+class StreamingVideoEncoder:
+    """
+    Encodes full-scale preview frames as they are produced.
+    Frames are piped as raw gray video into an ffmpeg H.264 encoder when ffmpeg is
+    available, otherwise written with OpenCV's mp4v writer.
+    """
+
+    def __init__(self, video_path, fps, size):
+        self.video_path = video_path
+        self.frame_count = 0
+        width, height = size
+        if check_ffmpeg(verbose=False):
+            self.writer = None
+            # Not a pipe: nothing reads it until close(), and a full pipe would stall the encoder
+            self.stderr_file = tempfile.TemporaryFile()
+            self.process = subprocess.Popen([
+                "ffmpeg", "-nostdin", "-loglevel", "error", "-y",
+                "-f", "rawvideo", "-pix_fmt", "gray", "-s", f"{width}x{height}", "-r", str(fps), "-i", "-",
+                "-vf", "pad=ceil(iw/2)*2:ceil(ih/2)*2",
+                "-c:v", "libx264", "-preset", "fast", "-crf", "23", "-pix_fmt", "yuv420p",
+                video_path
+            ],
+                stdin=subprocess.PIPE,
+                stderr=self.stderr_file,
+                creationflags=subprocess.CREATE_NO_WINDOW if os.name == 'nt' else 0
+            )
+        else:
+            self.process = None
+            self.writer = cv2.VideoWriter(video_path, cv2.VideoWriter_fourcc(*'mp4v'), fps, (width, height))
+
+    def write(self, image):
+        if self.process:
+            self.process.stdin.write(image.tobytes())
+        else:
+            self.writer.write(cv2.cvtColor(np.asarray(image), cv2.COLOR_GRAY2BGR))
+        self.frame_count += 1
+
+    def close(self):
+        """Finish the video. Returns its path, or None if encoding failed."""
+        if self.process:
+            try:
+                self.process.stdin.close()
+            except BrokenPipeError:
+                pass  # ffmpeg already exited; its exit status below reports the failure
+            returncode = self.process.wait()
+            stderr = read_process_log(self.stderr_file)
+            if returncode != 0:
+                logger.warning("⚠️  H.264 encoding failed: %s", stderr)
+                return None
+        else:
+            self.writer.release()
+        if os.path.exists(self.video_path) and os.path.getsize(self.video_path) > 0:
+            return self.video_path
+        return None
+
+def iter_directory_frames(input_dir):
+    """Frame source for a folder of images: yields (frame_number, filename, grayscale image or None)."""
+    filenames = sorted([f for f in os.listdir(input_dir) if f.lower().endswith((".png", ".jpg", ".jpeg"))], key=extract_number)
+    yield from iter_file_frames([os.path.join(input_dir, filename) for filename in filenames])
+
+def iter_file_frames(file_paths):
+    """Frame source for a list of image files, in the format of iter_directory_frames."""
+    for i, file_path in enumerate(file_paths):
+        yield i, os.path.basename(file_path), load_grayscale_image(file_path)
+
+def iter_video_frames(video_path, frames_per_second, settings):
+    """
+    Frame source for a video: decodes frames one at a time, with the same sampling and
+    backend choice as slice_video_to_frames, but without writing them to disk.
+    Settings can be a list of dicts when the frames feed several grids.
+    """
+    settings_list = settings if isinstance(settings, list) else [settings]
+    ingest_size = get_ingest_size(settings_list) if use_ffmpeg_decoder() else None
+    if ingest_size:
+        for i, frame in enumerate(iter_video_gray_frames_ffmpeg(video_path, frames_per_second, ingest_size)):
+            yield i, f"frame_{i:05d}.png", frame
+    else:
+        for i, frame in iter_video_frames_opencv(video_path, frames_per_second):
+            # Same BGR -> RGB -> 'L' conversion the frames got when they went through PNG files
+            yield i, f"frame_{i:05d}.png", Image.fromarray(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)).convert('L')
+
+def run_frame_pipeline(frames, struct_name, settings, workspace):
+    """
+    Turn a frame source into a C file, preview images and a video inside a workspace.
+    Returns the number of frames (see run_variants_pipeline).
+    """
+    return run_variants_pipeline(frames, [(struct_name, settings)], workspace)
+
+def run_variants_pipeline(frames, variant_settings, workspace, matrix_defines=False):
+    """
+    Turn a frame source into a C file, preview images and a video for every
+    (struct_name, settings) variant inside a workspace, decoding each frame only once.
+
+    The stages overlap, connected by bounded queues so a slow stage holds back the
+    others and memory stays constant however long the clip is:
+      decode (thread)  ->  grids + previews of every variant (this thread)  ->  one video encode thread per variant
+    Only the small grid arrays are kept; the C files are written from them once the
+    whole animation is known, so their encoding can be chosen. Returns the number of frames.
+    """
+    stop_event = threading.Event()
+    errors = []
+    decoded_frames = queue.Queue(maxsize=PIPELINE_QUEUE_SIZE)
+
+    variants = []
+    for struct_name, settings in variant_settings:
+        output_animation_dir, c_output_path = get_workspace_output_paths(workspace, struct_name)
+        variants.append({
+            'struct_name': struct_name,
+            'settings': settings,
+            'pixelator': Pixelator(settings),
+            'output_dir': output_animation_dir,
+            'c_output_path': c_output_path,
+            'video_path': os.path.join(output_animation_dir, f"{struct_name}_animation.mp4"),
+            'generate_video': settings.get('generate_video', True),
+            'preview_frames': queue.Queue(maxsize=PIPELINE_QUEUE_SIZE),
+            'encoded_video': [],
+            'grids': [],
+        })
+
+    def decode_stage():
+        try:
+            for item in frames:
+                if not _pipeline_put(decoded_frames, item, stop_event):
+                    return
+        except Exception as e:
+            errors.append(e)
+            stop_event.set()
+        finally:
+            _pipeline_put(decoded_frames, _PIPELINE_END, stop_event)
+
+    def encode_stage(variant):
+        # The video is optional: if encoding fails it is dropped, and the C code and previews still get made
+        video_path = variant['video_path']
+        video_fps = variant['settings'].get('video_fps', 30)
+        encoded_video = variant['encoded_video']
+        encoder = None
+        failed = False
+        while True:
+            image = _pipeline_get(variant['preview_frames'], stop_event)
+            if image is _PIPELINE_END:
+                break
+            if failed:
+                continue  # Keep draining so the frame stage is never blocked
+            try:
+                if encoder is None:
+                    logger.info("🎬 Encoding video at %s FPS while frames are processed...", video_fps)
+                    encoder = StreamingVideoEncoder(video_path, video_fps, image.size)
+                encoder.write(image)
+            except Exception as e:
+                logger.warning("⚠️  Video encoding failed, continuing without a video: %s", e)
+                failed = True
+        if encoder is not None:
+            try:
+                video = encoder.close()
+            except Exception as e:
+                logger.warning("⚠️  Video encoding failed, continuing without a video: %s", e)
+                video = None
+            encoded_video.append(None if failed else video)
+        if (failed or not encoded_video or not encoded_video[0]) and os.path.exists(video_path):
+            os.remove(video_path)
+
+    decoder = threading.Thread(target=decode_stage, name="decode", daemon=True)
+    video_encoders = [
+        threading.Thread(target=encode_stage, args=(variant,), name=f"encode-{variant['struct_name']}", daemon=True)
+        for variant in variants if variant['generate_video']
+    ]
+    decoder.start()
+    for video_encoder in video_encoders:
+        video_encoder.start()
+
+    frame_count = 0
+    frame_numbers = []
+    try:
+        while True:
+            item = _pipeline_get(decoded_frames, stop_event)
+            if item is _PIPELINE_END:
+                break
+            frame_number, filename, gray_img = item
+            if gray_img is None:
+                continue
+
+            for variant in variants:
+                settings = variant['settings']
+                final_image = variant['pixelator'].process(gray_img)['final']
+                variant['grids'].append(get_grid_array(final_image, settings))
+
+                full_scale_final = save_full_scale_image(final_image, os.path.join(variant['output_dir'], filename), settings)
+                if variant['generate_video']:
+                    _pipeline_put(variant['preview_frames'], full_scale_final, stop_event)
+            frame_numbers.append(frame_number)
+            frame_count += 1
+    except Exception:
+        stop_event.set()
+        raise
+    finally:
+        for variant in variants:
+            if variant['generate_video']:
+                _pipeline_put(variant['preview_frames'], _PIPELINE_END, stop_event)
+        for video_encoder in video_encoders:
+            video_encoder.join()
+        decoder.join()
+
+    if errors:
+        raise errors[0]
+
+    for variant in variants:
+        if not variant['generate_video']:
+            continue
+        video_path = variant['video_path']
+        if frame_count < 2 and os.path.exists(video_path):
+            os.remove(video_path)
+            logger.warning("⚠️  Need at least 2 frames to generate a video")
+        elif variant['encoded_video'] and variant['encoded_video'][0]:
+            logger.info("✅ Video successfully generated: %s", video_path)
+        else:
+            logger.warning("⚠️  Video generation failed")
+
+    if frame_count == 0:
+        return 0
+
+    for variant in variants:
+        emit_c_animation(variant['grids'], frame_numbers, variant['c_output_path'], variant['struct_name'],
+                         variant['settings'], matrix_defines)
+
+    return frame_count
+
 # ===============================================
 # MAIN EXECUTION
 # ===============================================
-def process_frames(input_dir, struct_name, custom_settings=None):
-    """Processes a directory of frames, generates C code, and cleans up."""
+def iter_with_progress(frames, total_files):
+    """Wrap a frame source with a progress bar on stdout, shown only at INFO level on a terminal."""
+    if not (logger.isEnabledFor(logging.INFO) and sys.stdout.isatty()):
+        yield from frames
+        return
+    for i, item in enumerate(frames):
+        yield item
+        progress = i + 1
+        bar_length = 40
+        percent = progress / total_files
+        filled_len = int(bar_length * percent)
+        bar = '█' * filled_len + '-' * (bar_length - filled_len)
+        sys.stdout.write(f'\r  [{bar}] {progress}/{total_files} frames decoded')
+        sys.stdout.flush()
+    print()
+
+def process_frames(input_dir, struct_name, custom_settings=None, workspace=None):
+    """Processes a directory of frames, generates C code, and cleans up. Returns the number of frames."""
     settings = get_processing_settings(custom_settings)
     
-    frame_data_list = []
-    # Use path relative to backend folder where this script is located
-    backend_dir = os.path.dirname(os.path.abspath(__file__))
-    output_animation_dir = os.path.join(backend_dir, "output_images", struct_name)
-    os.makedirs(output_animation_dir, exist_ok=True)
+    total_files = len([f for f in os.listdir(input_dir) if f.lower().endswith((".png", ".jpg", ".jpeg"))])
+    if total_files == 0:
+        return 0
     
-    filenames = sorted([f for f in os.listdir(input_dir) if f.lower().endswith((".png", ".jpg", ".jpeg"))], key=extract_number)
-    total_files = len(filenames)
+    logger.info("🖼️  Processing %d frames from '%s'...", total_files, os.path.basename(input_dir))
+    print_settings_summary(settings)
     
-    if total_files > 0:
-        print(f"🖼️  Processing {total_files} frames from '{os.path.basename(input_dir)}'...")
-        print(f"⚙️  Settings: Grid={settings['grid_width']}x{settings['grid_height']}, "
-              f"Contrast={'ON' if settings['enhance_contrast'] else 'OFF'}, "
-              f"Filter={settings['filter_threshold']}/{settings['dimming_threshold']}")
-        
-        for i, filename in enumerate(filenames):
-            input_file = os.path.join(input_dir, filename)
-            output_file = os.path.join(output_animation_dir, filename)
-            
-            final_pixelated = process_image(input_file, output_file, return_pixelated=True, settings=settings)
-            if final_pixelated:
-                frame_data_list.append((final_pixelated, i))
-            
-            progress = i + 1
-            bar_length = 40
-            percent = progress / total_files
-            filled_len = int(bar_length * percent)
-            bar = '█' * filled_len + '-' * (bar_length - filled_len)
-            sys.stdout.write(f'\r  [{bar}] {progress}/{total_files} frames processed')
-            sys.stdout.flush()
-        print()
-
-    if frame_data_list:
-        backend_dir = os.path.dirname(os.path.abspath(__file__))
-        c_output_path = os.path.join(backend_dir, "frames_as_c_code", f"{struct_name}.c")
-        generate_c_struct_array(frame_data_list, c_output_path, struct_name, settings)
-        
-        # Generate video from preview images
-        video_fps = settings.get('video_fps', 30)  # Use video-specific FPS
-        generate_video_enabled = settings.get('generate_video', True)
-        
-        if generate_video_enabled:
-            video_path = generate_video(output_animation_dir, struct_name, video_fps, settings)
-            if video_path:
-                print(f"🎬 Animation video saved to: {video_path}")
-            else:
-                print("⚠️  Video generation failed or skipped (need multiple frames)")
-        else:
-            print("ℹ️  Video generation disabled in settings")
-        
-        print(f"\n✅ Successfully created animation '{struct_name}' with {len(frame_data_list)} frames")
-        print(f"📁 C code saved to: {c_output_path}")
-        print(f"🖼️  Preview images saved to: {output_animation_dir}")
+    with use_workspace(workspace) as workspace:
+        frames = iter_with_progress(iter_directory_frames(input_dir), total_files)
+        frame_count = run_frame_pipeline(frames, struct_name, settings, workspace)
+        finish_animation(workspace, struct_name, frame_count)
+        return frame_count
+
+def process_video(video_path, struct_name, custom_settings=None, workspace=None):
+    """Streams a video through the pipeline without slicing it to disk first."""
+    settings = get_processing_settings(custom_settings)
+    frames_per_second = settings.get('fps', 10)
+    
+    logger.info("🎞️  Streaming '%s' at %s frames per second...", os.path.basename(video_path), frames_per_second)
+    print_settings_summary(settings)
+    
+    with use_workspace(workspace) as workspace:
+        frames = iter_video_frames(video_path, frames_per_second, settings)
+        frame_count = run_frame_pipeline(frames, struct_name, settings, workspace)
+        finish_animation(workspace, struct_name, frame_count)
+        return frame_count
+
+def print_settings_summary(settings):
+    logger.info("⚙️  Settings: Grid=%sx%s, Contrast=%s, Filter=%s/%s",
+                settings['grid_width'], settings['grid_height'],
+                'ON' if settings['enhance_contrast'] else 'OFF',
+                settings['filter_threshold'], settings['dimming_threshold'])
+
+def finish_animation(workspace, struct_name, frame_count):
+    """Publish a pipeline's output and report where it went."""
+    if frame_count == 0:
+        logger.warning("⚠️  No frames could be processed.")
+        return
+    
+    final_c_output_path, final_animation_dir = publish_animation(workspace, struct_name)
+    logger.info("✅ Successfully created animation '%s' with %d frames", struct_name, frame_count)
+    logger.info("📁 C code saved to: %s", final_c_output_path)
+    logger.info("🖼️  Preview images saved to: %s", final_animation_dir)
 
 # ===============================================
 # WRAPPER FUNCTIONS FOR FLASK APP
@@ -620,195 +1607,505 @@ def generate_live_preview(image_path, custom_settings=None):
     """
     Processes a single image with given settings and returns it as an in-memory image file.
     """
-    settings = get_processing_settings(custom_settings)
-    
-    result = process_single_image_to_grid(image_path, settings)
-    if not result:
+    pixelator = Pixelator(custom_settings)
+    try:
+        return io.BytesIO(pixelator.preview_png(image_path))
+    except Exception as e:
+        logger.error("Error opening or processing image: %s", e)
         return None
-    
-    final_image = result['final']
-    
-    # Scale up the image for a better preview
-    grid_width = settings['grid_width']
-    grid_height = settings['grid_height']
-    cell_aspect_ratio = settings['cell_aspect_ratio']
-    
-    preview_scale = 20 # Make the preview larger
-    preview_width = grid_width * preview_scale
-    preview_height = int(grid_height * preview_scale * cell_aspect_ratio)
-    
-    # Resize using NEAREST to maintain the pixelated look
-    preview_image = final_image.resize((preview_width, preview_height), Image.Resampling.NEAREST)
-    
-    # Save the image to an in-memory bytes buffer
-    img_io = io.BytesIO()
-    preview_image.save(img_io, 'PNG')
-    img_io.seek(0) # Rewind the buffer to the beginning
-    
-    return img_io
 
-def process_image_and_generate_c_code(image_path, struct_name, custom_settings=None):
-    """Processes a single image and generates C code for it."""
-    settings = get_processing_settings(custom_settings)
-    
-    # Create a temporary directory to hold the single image
-    temp_dir = f"temp_single_image_{struct_name}"
-    os.makedirs(temp_dir, exist_ok=True)
-    
+def process_image_and_generate_c_code(image_path, struct_name, custom_settings=None, variants=None, workspace=None):
+    """
+    Processes a single image and generates C code for it.
+    With a list of setting variants, returns a dict of C code per variant struct name instead.
+    Errors are returned as strings, except a FlashBudgetError, which is raised.
+    """
+    if variants:
+        try:
+            # A single frame makes no video
+            image_settings = dict(custom_settings or {}, generate_video=False)
+            return process_frames_for_variants(iter_file_frames([image_path]), struct_name, variants, image_settings, workspace)
+        except FlashBudgetError:
+            raise
+        except Exception as e:
+            return f"Error processing image: {str(e)}"
+
     try:
-        # Copy the image to temp directory with a standard name
-        temp_image_path = os.path.join(temp_dir, "frame_00000.png")
-        
-        # Process the image and get the final pixelated version
-        final_pixelated = process_image(image_path, temp_image_path, return_pixelated=True, settings=settings)
-        
-        if not final_pixelated:
-            return "Error: Could not process the image."
-        
-        # Create frame data list with single frame
-        frame_data_list = [(final_pixelated, 0)]
-        
-        # Generate C code with validation
-        backend_dir = os.path.dirname(os.path.abspath(__file__))
-        c_output_path = os.path.join(backend_dir, "frames_as_c_code", f"{struct_name}.c")
-        generate_c_struct_array(frame_data_list, c_output_path, struct_name, settings)
-        
-        # Note: Video generation skipped for single images (need multiple frames)
-        print("ℹ️  Video generation skipped - single image processing")
+        pixelator = Pixelator(custom_settings)
+        grid = pixelator.grid(image_path)
         
-        # Read and return the generated C code
-        with open(c_output_path, 'r') as f:
-            return f.read()
+        with use_workspace(workspace) as workspace:
+            _, c_output_path = get_workspace_output_paths(workspace, struct_name)
+            
+            # Generate C code with validation
+            emit_c_animation([grid], [0], c_output_path, struct_name, pixelator.settings)
+            
+            # Note: Video generation skipped for single images (need multiple frames)
+            logger.info("ℹ️  Video generation skipped - single image processing")
+            
+            # Read the generated C code before publishing it; single images have no previews to publish
+            with open(c_output_path, 'r') as f:
+                c_code = f.read()
+            publish_animation(workspace, struct_name, include_previews=False)
+            return c_code
             
+    except FlashBudgetError:
+        raise
     except Exception as e:
         return f"Error processing image: {str(e)}"
-    finally:
-        # Clean up temp directory
-        if os.path.exists(temp_dir):
-            shutil.rmtree(temp_dir)
 
-def process_directory_and_generate_c_code(directory_path, struct_name, custom_settings=None):
-    """Processes a directory of images and generates C code."""
+def process_directory_and_generate_c_code(directory_path, struct_name, custom_settings=None, variants=None, workspace=None):
+    """
+    Processes a directory of images and generates C code.
+    With a list of setting variants, every frame is decoded once and a dict of
+    C code per variant struct name is returned instead.
+    Errors are returned as strings, except a FlashBudgetError, which is raised.
+    """
     settings = get_processing_settings(custom_settings)
     
     try:
-        frame_data_list = []
-        # Use path relative to backend folder where this script is located
-        backend_dir = os.path.dirname(os.path.abspath(__file__))
-        output_animation_dir = os.path.join(backend_dir, "output_images", struct_name)
-        os.makedirs(output_animation_dir, exist_ok=True)
-        
         filenames = sorted([f for f in os.listdir(directory_path) if f.lower().endswith((".png", ".jpg", ".jpeg"))], key=extract_number)
         
         if not filenames:
             return "Error: No image files found in directory."
         
-        # Process all images
-        for i, filename in enumerate(filenames):
-            input_file = os.path.join(directory_path, filename)
-            output_file = os.path.join(output_animation_dir, filename)
-            
-            final_pixelated = process_image(input_file, output_file, return_pixelated=True, settings=settings)
-            if final_pixelated:
-                frame_data_list.append((final_pixelated, i))
-        
-        if not frame_data_list:
-            return "Error: Could not process any images."
-        
-        # Generate C code
-        backend_dir = os.path.dirname(os.path.abspath(__file__))
-        c_output_path = os.path.join(backend_dir, "frames_as_c_code", f"{struct_name}.c")
-        generate_c_struct_array(frame_data_list, c_output_path, struct_name, settings)
-        
-        # Generate video from preview images if we have multiple frames
-        if len(frame_data_list) > 1:
-            generate_video_enabled = settings.get('generate_video', True)
-            if generate_video_enabled:
-                video_fps = settings.get('video_fps', 30)
-                video_path = generate_video(output_animation_dir, struct_name, video_fps, settings)
-                if video_path:
-                    print(f"🎬 Generated animation video: {os.path.basename(video_path)}")
-                else:
-                    print("⚠️  Video generation failed")
-            else:
-                print("ℹ️  Video generation disabled in settings")
-        else:
-            print("ℹ️  Video generation skipped - need multiple frames")
-        
-        # Read and return the generated C code
-        with open(c_output_path, 'r') as f:
-            return f.read()
+        if variants:
+            return process_frames_for_variants(iter_directory_frames(directory_path), struct_name, variants, custom_settings, workspace)
+
+        with use_workspace(workspace) as workspace:
+            frame_count = run_frame_pipeline(iter_directory_frames(directory_path), struct_name, settings, workspace)
+            if frame_count == 0:
+                return "Error: Could not process any images."
+            return read_and_publish_c_code(workspace, struct_name)
             
+    except FlashBudgetError:
+        raise
     except Exception as e:
         return f"Error processing directory: {str(e)}"
 
-if __name__ == "__main__":
-    if len(sys.argv) < 2:
-        print("Usage:")
-        print("  python pixelate_and_convert.py <input_directory>")
-        print("  python pixelate_and_convert.py <video_file> --fps <frames_per_second>")
-        print("  python pixelate_and_convert.py <video_file> --fps 10 --struct-name my_animation")
-        sys.exit(1)
-    
-    input_path = sys.argv[1]
+def process_video_and_generate_c_code(video_path, struct_name, custom_settings=None, variants=None, workspace=None):
+    """
+    Streams a video through the pipeline and generates C code, without slicing frames to disk.
+    With a list of setting variants, every frame is decoded once for all of them and a dict
+    of C code per variant struct name is returned instead.
+    Errors are returned as strings, except a FlashBudgetError, which is raised.
+    """
+    settings = get_processing_settings(custom_settings)
     
-    # --- Video Processing Logic ---
-    if input_path.lower().endswith(('.mp4', '.avi', '.mov', '.mkv')):
-        if input_path.lower().endswith('.mov'):
-            converted_path = convert_mov_to_mp4(input_path)
-            if converted_path:
-                input_path = converted_path
-            else:
-                print("Aborting due to conversion failure.")
-                sys.exit(1)
+    try:
+        with use_workspace(workspace) as workspace:
+            if variants:
+                # The decoder only needs to keep enough resolution for the grids being rendered
+                ingest_settings = [dict(settings, **variant) for variant in variants]
+                frames = iter_video_frames(video_path, settings['fps'], ingest_settings)
+                return process_frames_for_variants(frames, struct_name, variants, settings, workspace,
+                                                   empty_error="Error: Could not extract frames from video.")
+            
+            frames = iter_video_frames(video_path, settings['fps'], settings)
+            frame_count = run_frame_pipeline(frames, struct_name, settings, workspace)
+            if frame_count == 0:
+                return "Error: Could not extract frames from video."
+            return read_and_publish_c_code(workspace, struct_name)
+            
+    except FlashBudgetError:
+        raise
+    except Exception as e:
+        return f"Error processing video: {str(e)}"
 
-        fps = 10
-        struct_name = None
-        
-        # Command-line argument parsing
-        i = 2
-        while i < len(sys.argv):
-            if sys.argv[i] == '--fps' and i + 1 < len(sys.argv):
-                try:
-                    fps = int(sys.argv[i + 1])
-                    i += 2
-                except ValueError:
-                    print(f"Error: Invalid FPS value '{sys.argv[i+1]}'. Must be an integer.")
-                    sys.exit(1)
-            elif sys.argv[i] == '--struct-name' and i + 1 < len(sys.argv):
-                struct_name = sys.argv[i + 1]
-                i += 2
-            else:
-                print(f"Warning: Ignoring unrecognized argument '{sys.argv[i]}'")
-                i += 1
-        
-        if struct_name is None:
-            video_name = os.path.splitext(os.path.basename(input_path))[0]
-            struct_name = re.sub(r'[^a-zA-Z0-9_]', '_', video_name).lower()
+def read_and_publish_c_code(workspace, struct_name):
+    """Read the generated C code, then publish everything at once."""
+    _, c_output_path = get_workspace_output_paths(workspace, struct_name)
+    with open(c_output_path, 'r') as f:
+        c_code = f.read()
+    publish_animation(workspace, struct_name)
+    return c_code
+
+# ===============================================
+# MULTI-GRID BATCH RENDERING
+# ===============================================
+
+# Settings that only affect decoding and therefore can't differ between variants.
+SHARED_DECODE_SETTINGS = ('fps',)
+
+def derive_variant_struct_name(struct_name, variant_settings):
+    """Derive a C identifier for a variant, e.g. my_animation_32x16 or my_animation_32x16_ar2_0."""
+    name = f"{struct_name}_{variant_settings['grid_width']}x{variant_settings['grid_height']}"
+    if variant_settings['cell_aspect_ratio'] != CELL_ASPECT_RATIO:
+        name += f"_ar{variant_settings['cell_aspect_ratio']}"
+    return re.sub(r'[^a-zA-Z0-9_]', '_', name).lower()
+
+def build_variant_settings(struct_name, variants, custom_settings=None):
+    """
+    Expand a list of setting overrides into (struct_name, settings) pairs.
+    Each variant may set its own 'struct_name'; otherwise one is derived from the grid.
+    """
+    base_settings = get_processing_settings(custom_settings)
+    expanded = []
+    used_names = set()
+    
+    for variant in variants:
+        overrides = {k: v for k, v in variant.items() if k != 'struct_name' and k not in SHARED_DECODE_SETTINGS}
+        variant_settings = dict(base_settings)
+        variant_settings.update(overrides)
         
-        temp_frames_dir = f"temp_frames_{struct_name}"
+        variant_name = variant.get('struct_name') or derive_variant_struct_name(struct_name, variant_settings)
+        variant_name = re.sub(r'[^a-zA-Z0-9_]', '_', variant_name)
+        unique_name = variant_name
+        suffix = 1
+        while unique_name in used_names:
+            unique_name = f"{variant_name}_{suffix}"
+            suffix += 1
+        used_names.add(unique_name)
         
-        print(f"🎬 Processing video: {input_path}")
-        print(f"📊 FPS: {fps}, Struct name: {struct_name}")
+        expanded.append((unique_name, variant_settings))
+    
+    return expanded
+
+def process_frames_for_variants(frames, struct_name, variants, custom_settings=None, workspace=None,
+                                empty_error="Error: Could not process any images."):
+    """
+    Decode every frame of a frame source once and fan it out to all variant grids,
+    each with its own video encoder (see run_variants_pipeline).
+    Returns a dict mapping each variant struct name to its C code, or an error string.
+    """
+    variant_settings = build_variant_settings(struct_name, variants, custom_settings)
+    if not variant_settings:
+        return "Error: No setting variants given."
+    
+    with use_workspace(workspace) as workspace:
+        logger.info("🖼️  Processing frames for %d grid variants...", len(variant_settings))
+        if run_variants_pipeline(frames, variant_settings, workspace, matrix_defines=True) == 0:
+            return empty_error
         
-        slice_video_to_frames(input_path, temp_frames_dir, fps)
+        c_code_by_variant = {}
+        for name, _ in variant_settings:
+            _, c_output_path = get_workspace_output_paths(workspace, name)
+            with open(c_output_path, 'r') as f:
+                c_code_by_variant[name] = f.read()
         
-        if os.path.exists(temp_frames_dir) and os.listdir(temp_frames_dir):
-            process_frames(temp_frames_dir, struct_name)
-            shutil.rmtree(temp_frames_dir)
-            print(f"🗑️  Cleaned up temporary frames from {temp_frames_dir}")
+        for name, _ in variant_settings:
+            publish_animation(workspace, name)
+        logger.info("✅ Generated %d variants: %s", len(c_code_by_variant), ', '.join(c_code_by_variant))
+        return c_code_by_variant
+
+# ===============================================
+# BATCH COMMAND LINE INTERFACE
+# ===============================================
+
+VIDEO_EXTENSIONS = ('.mp4', '.avi', '.mov', '.mkv')
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg')
+
+# Value types for every setting that can be given on the command line or in a manifest.
+SETTING_TYPES = {
+    'grid_width': int,
+    'grid_height': int,
+    'enhance_contrast': bool,
+    'sigmoid_k': float,
+    'sigmoid_center': float,
+    'filter_threshold': int,
+    'dimming_threshold': int,
+    'cell_aspect_ratio': float,
+    'fps': int,
+    'video_fps': int,
+    'generate_video': bool,
+    'encoding': str,
+    'flash_budget_bytes': int,
+}
+
+def sanitize_struct_name(name):
+    """Turn an arbitrary name into a lowercase C identifier."""
+    return re.sub(r'[^a-zA-Z0-9_]', '_', name).lower()
+
+def parse_setting_value(key, value):
+    """Convert a manifest value (possibly a CSV string) to the setting's type."""
+    if SETTING_TYPES[key] is bool and isinstance(value, str):
+        return value.strip().lower() in ('1', 'true', 'yes', 'on')
+    return SETTING_TYPES[key](value)
+
+def load_manifest(manifest_path):
+    """
+    Load a JSON (list of objects) or CSV manifest of inputs.
+    Each entry needs a 'path' and may set 'struct_name' and any setting from SETTING_TYPES.
+    Relative paths are resolved against the manifest's folder.
+    """
+    import csv
+
+    with open(manifest_path, 'r', newline='') as f:
+        if manifest_path.lower().endswith('.csv'):
+            rows = list(csv.DictReader(f))
         else:
-            print("No frames were extracted. Aborting.")
-            if os.path.exists(temp_frames_dir):
-                shutil.rmtree(temp_frames_dir)
-
-    # --- Image Directory Processing Logic ---
-    elif os.path.isdir(input_path):
-        struct_name_input = input("Enter the name for your C struct and file: ")
-        struct_name = re.sub(r'[^a-zA-Z0-9_]', '_', struct_name_input).lower()
-        if not struct_name:
-            print("Invalid struct name. Aborting.")
-            sys.exit(1)
-        process_frames(input_path, struct_name)
+            rows = json.load(f)
+
+    manifest_dir = os.path.dirname(os.path.abspath(manifest_path))
+    entries = []
+    for row in rows:
+        if not row.get('path'):
+            raise ValueError(f"Manifest entry without a path: {row}")
+        settings = {}
+        for key, value in row.items():
+            if key in ('path', 'struct_name') or value in (None, ''):
+                continue
+            if key not in SETTING_TYPES:
+                raise ValueError(f"Unknown setting '{key}' in manifest entry for {row['path']}")
+            settings[key] = parse_setting_value(key, value)
+        entries.append({
+            'path': os.path.join(manifest_dir, row['path']),
+            'struct_name': row.get('struct_name') or None,
+            'settings': settings,
+        })
+    return entries
+
+def hash_batch_input(path, struct_name, settings):
+    """Hash the source bytes (every image file for a directory), struct name and settings."""
+    import hashlib
+
+    digest = hashlib.sha256()
+    digest.update(json.dumps({'struct_name': struct_name, 'settings': settings}, sort_keys=True).encode())
+
+    if os.path.isdir(path):
+        file_paths = [os.path.join(path, f) for f in sorted(os.listdir(path)) if f.lower().endswith(IMAGE_EXTENSIONS)]
     else:
-        print(f"Error: Input '{input_path}' is not a valid video file or directory.")
\ No newline at end of file
+        file_paths = [path]
+
+    for file_path in file_paths:
+        digest.update(os.path.basename(file_path).encode())
+        with open(file_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                digest.update(chunk)
+    return digest.hexdigest()
+
+def get_mtime_or_none(path):
+    try:
+        return os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+def run_batch_job(job):
+    """
+    Process one batch input (video, image directory or single image).
+    Runs in a worker process, so it takes and returns plain dicts.
+    """
+    import time
+
+    input_path = job['path']
+    struct_name = job['struct_name']
+    settings = get_processing_settings(job['settings'])
+    settings.setdefault('fps', 10)
+    start_time = time.perf_counter()
+    error = None
+
+    # An existing C file from an earlier run must not pass for this job's output
+    c_output_path, video_path = get_output_paths(struct_name)
+    previous_c_mtime = get_mtime_or_none(c_output_path)
+
+    try:
+        if input_path.lower().endswith(VIDEO_EXTENSIONS):
+            if input_path.lower().endswith('.mov'):
+                input_path = convert_mov_to_mp4(input_path)
+                if not input_path:
+                    raise RuntimeError("Conversion from .mov failed")
+
+            with Workspace() as workspace:
+                if job['decode_shards'] > 1 and not use_ffmpeg_decoder():
+                    temp_frames_dir = workspace.makedirs("frames")
+                    slice_video_to_frames(input_path, temp_frames_dir, settings['fps'], settings, job['decode_shards'])
+                    if process_frames(temp_frames_dir, struct_name, settings, workspace) == 0:
+                        raise RuntimeError("No frames were extracted")
+                elif process_video(input_path, struct_name, settings, workspace) == 0:
+                    raise RuntimeError("No frames were extracted")
+
+        elif os.path.isdir(input_path):
+            if process_frames(input_path, struct_name, settings) == 0:
+                raise RuntimeError("No frames could be processed")
+
+        elif input_path.lower().endswith(IMAGE_EXTENSIONS):
+            result = process_image_and_generate_c_code(input_path, struct_name, settings)
+            if result.startswith("Error"):
+                raise RuntimeError(result)
+
+        else:
+            raise ValueError("Not a video file, image or directory")
+
+    except Exception as e:
+        error = str(e)
+
+    c_code_mtime = get_mtime_or_none(c_output_path)
+    if error is None and (c_code_mtime is None or c_code_mtime == previous_c_mtime):
+        error = "No C code was generated"
+
+    return {
+        'path': job['path'],
+        'struct_name': struct_name,
+        'status': 'failed' if error else 'processed',
+        'error': error,
+        'seconds': round(time.perf_counter() - start_time, 3),
+        'c_code_bytes': os.path.getsize(c_output_path) if os.path.exists(c_output_path) else 0,
+        'video_bytes': os.path.getsize(video_path) if os.path.exists(video_path) else 0,
+        'input_hash': job['input_hash'],
+    }
+
+def build_arg_parser():
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description="Convert videos, image folders or single images to C animation structs.",
+    )
+    parser.add_argument('inputs', nargs='*', help="Video files, image directories or images to convert.")
+    parser.add_argument('--manifest', help="JSON or CSV manifest with path, struct_name and per-input settings.")
+    parser.add_argument('--struct-name', help="Struct name (only valid with a single input). "
+                                              "Defaults to the sanitized input file or folder name.")
+    parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count() or 1,
+                        help="Number of inputs to process in parallel (default: CPU count).")
+    parser.add_argument('--force', action='store_true', help="Reprocess inputs even if unchanged since the last run.")
+    parser.add_argument('--state-file', default=os.path.join(os.path.dirname(os.path.abspath(__file__)), ".batch_state.json"),
+                        help="Where source/settings hashes from previous runs are kept.")
+    parser.add_argument('--report', help="Write a JSON summary report of timings and output sizes to this path.")
+    parser.add_argument('--log-level', default="INFO", choices=["DEBUG", "INFO", "WARNING", "ERROR"],
+                        help="Verbosity of progress messages. DEBUG adds per-frame details.")
+    parser.add_argument('--decode-shards', type=int, default=VIDEO_DECODE_SHARDS,
+                        help="Split each video's duration across this many decoder processes "
+                             "(OpenCV decoding only; ffmpeg is multi-threaded already).")
+
+    settings_group = parser.add_argument_group("processing settings")
+    settings_group.add_argument('--grid-width', type=int, help=f"Grid width (default: {GRID_WIDTH}).")
+    settings_group.add_argument('--grid-height', type=int, help=f"Grid height (default: {GRID_HEIGHT}).")
+    settings_group.add_argument('--cell-aspect-ratio', type=float, help=f"Cell height/width ratio (default: {CELL_ASPECT_RATIO}).")
+    settings_group.add_argument('--enhance-contrast', action=argparse.BooleanOptionalAction, default=None,
+                                help=f"Apply sigmoid contrast enhancement (default: {ENHANCE_CONTRAST}).")
+    settings_group.add_argument('--sigmoid-k', type=float, help=f"Sigmoid steepness (default: {SIGMOID_K}).")
+    settings_group.add_argument('--sigmoid-center', type=float, help=f"Sigmoid midpoint (default: {SIGMOID_CENTER}).")
+    settings_group.add_argument('--filter-threshold', type=int, help=f"Pixels at or below are turned off (default: {FILTER_THRESHOLD}).")
+    settings_group.add_argument('--dimming-threshold', type=int, help=f"Pixels up to this are dimmed (default: {DIMMING_THRESHOLD}).")
+    settings_group.add_argument('--fps', type=int, help="Frames per second sliced from videos (default: 10).")
+    settings_group.add_argument('--video-fps', type=int, help="Frame rate of the preview video (default: 30).")
+    settings_group.add_argument('--generate-video', action=argparse.BooleanOptionalAction, default=None,
+                                help="Render a preview video for animations (default: True).")
+    settings_group.add_argument('--encoding', choices=C_ENCODINGS,
+                                help=f"Layout of the generated C data (default: {C_ENCODING}).")
+    settings_group.add_argument('--flash-budget-bytes', type=int,
+                                help="Byte budget for an animation's C data. The cheapest encoding that fits is "
+                                     "picked, dropping frames evenly if none fits (default: no limit).")
+    return parser
+
+def build_batch_jobs(args, parser):
+    """Combine positional inputs and manifest entries into jobs with merged settings."""
+    cli_settings = {key: getattr(args, key) for key in SETTING_TYPES if getattr(args, key) is not None}
+    cli_settings.setdefault('fps', 10)
+
+    entries = [{'path': path, 'struct_name': None, 'settings': {}} for path in args.inputs]
+    if args.manifest:
+        entries.extend(load_manifest(args.manifest))
+
+    if not entries:
+        parser.error("no inputs given")
+    if args.struct_name:
+        if len(entries) > 1:
+            parser.error("--struct-name can only be used with a single input")
+        entries[0]['struct_name'] = args.struct_name
+
+    jobs = []
+    for entry in entries:
+        path = os.path.normpath(entry['path'])
+        default_name = os.path.splitext(os.path.basename(path))[0]
+        settings = dict(cli_settings)
+        settings.update(entry['settings'])
+        try:
+            validate_settings(settings)
+        except ValueError as e:
+            parser.error(f"{entry['path']}: {e}")
+        jobs.append({
+            'path': path,
+            'struct_name': sanitize_struct_name(entry['struct_name'] or default_name),
+            'settings': settings,
+            'decode_shards': args.decode_shards,
+        })
+
+    struct_names = [job['struct_name'] for job in jobs]
+    duplicates = sorted({name for name in struct_names if struct_names.count(name) > 1})
+    if duplicates:
+        parser.error(f"duplicate struct names in batch: {', '.join(duplicates)}")
+    return jobs
+
+def configure_logging(level):
+    """Log plain messages to stderr. Also run in each batch worker process."""
+    logging.basicConfig(level=level, format="%(message)s")
+
+def main(argv=None):
+    import time
+    from concurrent.futures import ProcessPoolExecutor
+
+    parser = build_arg_parser()
+    args = parser.parse_args(argv)
+    configure_logging(args.log_level)
+    jobs = build_batch_jobs(args, parser)
+
+    try:
+        with open(args.state_file, 'r') as f:
+            state = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        state = {}
+
+    results = []
+    pending_jobs = []
+    for job in jobs:
+        if not os.path.exists(job['path']):
+            results.append({'path': job['path'], 'struct_name': job['struct_name'], 'status': 'failed',
+                            'error': "Input not found", 'seconds': 0.0, 'c_code_bytes': 0, 'video_bytes': 0})
+            continue
+
+        job['input_hash'] = hash_batch_input(job['path'], job['struct_name'], job['settings'])
+        c_output_path, video_path = get_output_paths(job['struct_name'])
+        if not args.force and state.get(job['struct_name']) == job['input_hash'] and os.path.exists(c_output_path):
+            results.append({'path': job['path'], 'struct_name': job['struct_name'], 'status': 'skipped',
+                            'error': None, 'seconds': 0.0,
+                            'c_code_bytes': os.path.getsize(c_output_path),
+                            'video_bytes': os.path.getsize(video_path) if os.path.exists(video_path) else 0})
+        else:
+            pending_jobs.append(job)
+
+    print(f"📦 {len(jobs)} inputs: {len(pending_jobs)} to process, {len(jobs) - len(pending_jobs)} skipped or missing")
+
+    start_time = time.perf_counter()
+    if pending_jobs:
+        workers = max(1, min(args.jobs, len(pending_jobs)))
+        with ProcessPoolExecutor(max_workers=workers, initializer=configure_logging,
+                                 initargs=(args.log_level,)) as executor:
+            for result in executor.map(run_batch_job, pending_jobs):
+                results.append(result)
+                if result['status'] == 'processed':
+                    state[result['struct_name']] = result.pop('input_hash')
+                else:
+                    result.pop('input_hash')
+                    state.pop(result['struct_name'], None)
+    total_seconds = round(time.perf_counter() - start_time, 3)
+
+    with open(args.state_file, 'w') as f:
+        json.dump(state, f, indent=2, sort_keys=True)
+
+    print("\n📊 Batch summary:")
+    for result in results:
+        line = (f"   {result['status']:<9} {result['struct_name']:<30} {result['seconds']:>8.2f}s  "
+                f"C: {result['c_code_bytes']:>9} B  video: {result['video_bytes']:>9} B")
+        if result['error']:
+            line += f"  ({result['error']})"
+        print(line)
+
+    failed = [r for r in results if r['status'] == 'failed']
+    print(f"⏱️  Total: {total_seconds:.2f}s, {len(failed)} failed")
+
+    if args.report:
+        report = {
+            'total_seconds': total_seconds,
+            'processed': sum(1 for r in results if r['status'] == 'processed'),
+            'skipped': sum(1 for r in results if r['status'] == 'skipped'),
+            'failed': len(failed),
+            'results': results,
+        }
+        with open(args.report, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"📝 Report written to {args.report}")
+
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
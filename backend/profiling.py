@@ -0,0 +1,193 @@
+# backend/profiling.py
+
+import cProfile
+import json
+import os
+import pstats
+import random
+import re
+import threading
+import time
+import uuid
+from collections import defaultdict
+
+# =============================================================================
+# --- SETTINGS ---
+# =============================================================================
+
+# Fraction of requests profiled in the background, on top of explicitly requested profiles.
+PROFILE_SAMPLE_RATE = float(os.environ.get("PIXELATOR_PROFILE_SAMPLE_RATE", 0.0))
+# Folder profiles are kept in, and how many are kept before the oldest are removed.
+PROFILE_DIR = os.environ.get("PIXELATOR_PROFILE_DIR",
+                             os.path.join(os.path.dirname(os.path.abspath(__file__)), "profiles"))
+PROFILE_MAX_STORED = int(os.environ.get("PIXELATOR_PROFILE_MAX_STORED", 50))
+# Call chains deeper than this, or worth less than a microsecond, are cut off in collapsed stacks.
+COLLAPSED_MAX_DEPTH = 64
+COLLAPSED_MIN_SECONDS = 1e-6
+
+PROFILE_ID_PATTERN = re.compile(r"^[0-9a-f]{32}$")
+
+# =============================================================================
+# PROFILE STORE
+# =============================================================================
+
+class ProfileStore:
+    """
+    Runs single requests under cProfile and keeps the results on disk by id.
+    Each profile is a .pstats dump plus a small .json file describing the request.
+    Only one profile is recorded at a time; requests arriving meanwhile run unprofiled.
+    cProfile follows the request's own thread, so the pipeline's decode and
+    encode threads show up only as time spent waiting on their queues.
+    """
+
+    def __init__(self, directory=PROFILE_DIR, max_stored=PROFILE_MAX_STORED, sample_rate=PROFILE_SAMPLE_RATE):
+        self.directory = directory
+        self.max_stored = max_stored
+        self.sample_rate = sample_rate
+        self._busy = threading.Lock()
+
+    def should_sample(self):
+        """Random background sampling at the configured rate."""
+        return self.sample_rate > 0 and random.random() < self.sample_rate
+
+    def run(self, label, func, *args, **kwargs):
+        """Call func under the profiler. Returns (result, profile_id), profile_id being None if busy."""
+        if not self._busy.acquire(blocking=False):
+            return func(*args, **kwargs), None
+
+        profile_id = uuid.uuid4().hex
+        profiler = cProfile.Profile()
+        started_at = time.time()
+        start = time.perf_counter()
+        try:
+            profiler.enable()
+            try:
+                result = func(*args, **kwargs)
+            finally:
+                profiler.disable()
+        finally:
+            self._busy.release()
+            seconds = time.perf_counter() - start
+            self._save(profile_id, profiler, {
+                'id': profile_id,
+                'label': label,
+                'started_at': started_at,
+                'seconds': round(seconds, 6),
+            })
+        return result, profile_id
+
+    def list(self):
+        """Metadata of the stored profiles, newest first."""
+        profiles = []
+        for profile_id in self._stored_ids():
+            metadata = self.metadata(profile_id)
+            if metadata:
+                profiles.append(metadata)
+        return sorted(profiles, key=lambda p: p['started_at'], reverse=True)
+
+    def metadata(self, profile_id):
+        try:
+            with open(self._path(profile_id, ".json"), 'r') as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError, ValueError):
+            return None
+
+    def pstats_path(self, profile_id):
+        """Path of a profile's pstats dump, or None if it doesn't exist."""
+        try:
+            path = self._path(profile_id, ".pstats")
+        except ValueError:
+            return None
+        return path if os.path.exists(path) else None
+
+    def collapsed(self, profile_id):
+        """A profile as collapsed stacks (one 'a;b;c microseconds' line per stack), or None."""
+        path = self.pstats_path(profile_id)
+        if path is None:
+            return None
+        return collapse_stats(pstats.Stats(path))
+
+    # --- Storage ---
+
+    def _path(self, profile_id, extension):
+        if not PROFILE_ID_PATTERN.match(profile_id):
+            raise ValueError(f"Invalid profile id '{profile_id}'")
+        return os.path.join(self.directory, profile_id + extension)
+
+    def _stored_ids(self):
+        if not os.path.isdir(self.directory):
+            return []
+        return [name[:-len(".pstats")] for name in os.listdir(self.directory) if name.endswith(".pstats")]
+
+    def _save(self, profile_id, profiler, metadata):
+        os.makedirs(self.directory, exist_ok=True)
+        profiler.dump_stats(self._path(profile_id, ".pstats"))
+        with open(self._path(profile_id, ".json"), 'w') as f:
+            json.dump(metadata, f)
+        self._prune()
+
+    def _prune(self):
+        stored = sorted(self._stored_ids(), key=lambda i: os.path.getmtime(self._path(i, ".pstats")))
+        for profile_id in stored[:max(0, len(stored) - self.max_stored)]:
+            for extension in (".pstats", ".json"):
+                try:
+                    os.remove(self._path(profile_id, extension))
+                except FileNotFoundError:
+                    pass
+
+# =============================================================================
+# COLLAPSED STACKS
+# =============================================================================
+
+def format_function(func):
+    filename, line, name = func
+    if filename == '~':  # Built-ins such as {method 'read' of ...}
+        return name
+    return f"{name} ({os.path.basename(filename)}:{line})"
+
+def collapse_stats(stats):
+    """
+    Convert pstats data to the collapsed stack format read by flame graph tools.
+    cProfile only records caller/callee pairs, so each function's own time is spread
+    over the call chains leading to it in proportion to the time spent along each edge.
+    """
+    callees = defaultdict(dict)
+    roots = []
+    for func, (_, _, _, _, callers) in stats.stats.items():
+        if not callers:
+            roots.append(func)
+        for caller, (_, _, _, edge_cumulative) in callers.items():
+            callees[caller][func] = edge_cumulative
+
+    totals = defaultdict(float)
+
+    def walk(func, path, share):
+        own_time = stats.stats[func][2]
+        path = path + (format_function(func),)
+        totals[path] += own_time * share
+        if len(path) >= COLLAPSED_MAX_DEPTH:
+            return
+        for callee, edge_cumulative in callees[func].items():
+            callee_cumulative = stats.stats[callee][3]
+            if callee_cumulative <= 0 or share * edge_cumulative < COLLAPSED_MIN_SECONDS or format_function(callee) in path:
+                continue
+            walk(callee, path, share * edge_cumulative / callee_cumulative)
+
+    for root in roots:
+        walk(root, (), 1.0)
+
+    lines = []
+    for path, seconds in totals.items():
+        microseconds = int(round(seconds * 1e6))
+        if microseconds > 0:
+            lines.append(f"{';'.join(path)} {microseconds}")
+    return "\n".join(sorted(lines)) + "\n"
+
+_default_store = None
+
+def get_profile_store():
+    """The profile store configured from the environment."""
+    global _default_store
+    if _default_store is None:
+        _default_store = ProfileStore()
+    return _default_store
@@ -0,0 +1,56 @@
+# backend/tests/test_sharded_decode.py
+#
+# Sharded OpenCV decoding must yield exactly the frames of the sequential decoder.
+#
+#   python3 -m pytest backend/tests
+
+import os
+import sys
+
+import cv2
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pixelate_and_convert import get_source_frame_index, slice_video_to_frames
+
+SOURCE_FPS = 24
+SOURCE_FRAMES = 60
+FRAME_SIZE = (64, 48)
+
+@pytest.fixture(scope="module")
+def clip_path(tmp_path_factory):
+    """A short clip whose frames all differ, so a frame taken from the wrong position shows up."""
+    path = str(tmp_path_factory.mktemp("clip") / "clip.mp4")
+    width, height = FRAME_SIZE
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*'mp4v'), SOURCE_FPS, FRAME_SIZE)
+    for i in range(SOURCE_FRAMES):
+        frame = np.full((height, width, 3), (i * 4) % 256, dtype=np.uint8)
+        cv2.rectangle(frame, (i % width, 0), (i % width + 8, height // 2), (255, 255, 255), -1)
+        cv2.putText(frame, str(i), (2, height - 4), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 0, 255), 1)
+        writer.write(frame)
+    writer.release()
+    return path
+
+def read_frames(folder):
+    frames = {}
+    for name in sorted(os.listdir(folder)):
+        with open(os.path.join(folder, name), 'rb') as f:
+            frames[name] = f.read()
+    return frames
+
+@pytest.mark.parametrize("frames_per_second", [7, 10, 30, 48])
+@pytest.mark.parametrize("shards", [2, 3])
+def test_sharded_decode_matches_sequential(clip_path, tmp_path, frames_per_second, shards):
+    sequential_dir = str(tmp_path / "sequential")
+    sharded_dir = str(tmp_path / "sharded")
+
+    slice_video_to_frames(clip_path, sequential_dir, frames_per_second, shards=1)
+    slice_video_to_frames(clip_path, sharded_dir, frames_per_second, shards=shards)
+
+    sequential = read_frames(sequential_dir)
+    output_frames = range(int(SOURCE_FRAMES / SOURCE_FPS * frames_per_second))
+    assert len(sequential) == sum(1 for i in output_frames
+                                  if get_source_frame_index(i, frames_per_second, SOURCE_FPS) < SOURCE_FRAMES)
+    assert read_frames(sharded_dir) == sequential
@@ -0,0 +1,154 @@
+# backend/workspace.py
+
+import os
+import shutil
+import tempfile
+import threading
+import uuid
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+# =============================================================================
+# --- SETTINGS ---
+# =============================================================================
+
+# "memory" keeps workspaces on a tmpfs (RAM-backed) mount when one exists, "disk" uses the system temp folder.
+WORKSPACE_BACKEND = os.environ.get("PIXELATOR_WORKSPACE_BACKEND", "memory")
+# Overrides the folder workspaces are created in, whatever the backend.
+WORKSPACE_ROOT = os.environ.get("PIXELATOR_WORKSPACE_ROOT")
+
+TMPFS_CANDIDATES = ("/dev/shm", "/run/shm")
+
+_thread_locks = {}
+_thread_locks_guard = threading.Lock()
+
+# =============================================================================
+# WORKSPACES
+# =============================================================================
+
+def get_workspace_root(backend=None):
+    """Pick the folder new workspaces are created in."""
+    if WORKSPACE_ROOT:
+        return WORKSPACE_ROOT
+
+    if (backend or WORKSPACE_BACKEND) == "memory":
+        for candidate in TMPFS_CANDIDATES:
+            if os.path.isdir(candidate) and os.access(candidate, os.W_OK):
+                return candidate
+
+    return tempfile.gettempdir()
+
+class Workspace:
+    """
+    A private scratch folder for one request, identified by a unique id.
+    Intermediate files live here and are thrown away on cleanup; final
+    artifacts are moved into their shared location with publish_file/publish_dir,
+    so other requests never see half-written output.
+    """
+
+    def __init__(self, backend=None, prefix="pixelator"):
+        self.id = uuid.uuid4().hex
+        self.root = os.path.join(get_workspace_root(backend), f"{prefix}_{self.id}")
+        os.makedirs(self.root)
+
+    def path(self, *parts):
+        """Path inside the workspace. Parent folders are created."""
+        full_path = os.path.join(self.root, *parts)
+        os.makedirs(os.path.dirname(full_path), exist_ok=True)
+        return full_path
+
+    def makedirs(self, *parts):
+        """Create and return a folder inside the workspace."""
+        full_path = os.path.join(self.root, *parts)
+        os.makedirs(full_path, exist_ok=True)
+        return full_path
+
+    def publish_file(self, source_path, destination_path):
+        """
+        Atomically place a workspace file at its final location.
+        The file is staged next to the destination first so the final rename never crosses filesystems.
+        """
+        os.makedirs(os.path.dirname(destination_path), exist_ok=True)
+        staging_path = self._staging_path(destination_path)
+        try:
+            shutil.copyfile(source_path, staging_path)
+            os.replace(staging_path, destination_path)
+        finally:
+            if os.path.exists(staging_path):
+                os.remove(staging_path)
+        return destination_path
+
+    def publish_dir(self, source_dir, destination_dir):
+        """
+        Replace a shared folder with a workspace folder.
+        The new folder is staged next to the destination and swapped in by renames,
+        so readers see either the old or the new contents, never a mix.
+        """
+        os.makedirs(os.path.dirname(destination_dir), exist_ok=True)
+        staging_dir = self._staging_path(destination_dir)
+        retired_dir = staging_dir + ".old"
+        shutil.copytree(source_dir, staging_dir)
+        try:
+            # Two publishers swapping the same folder must not interleave their renames
+            with locked_file(os.path.join(os.path.dirname(destination_dir), ".publish")):
+                if os.path.exists(destination_dir):
+                    os.rename(destination_dir, retired_dir)
+                os.rename(staging_dir, destination_dir)
+        finally:
+            if os.path.exists(staging_dir):
+                shutil.rmtree(staging_dir)
+            if os.path.exists(retired_dir):
+                shutil.rmtree(retired_dir, ignore_errors=True)
+        return destination_dir
+
+    def cleanup(self):
+        shutil.rmtree(self.root, ignore_errors=True)
+
+    def _staging_path(self, destination_path):
+        parent, name = os.path.split(destination_path)
+        return os.path.join(parent, f".{name}.{self.id}.tmp")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.cleanup()
+
+@contextmanager
+def use_workspace(workspace=None):
+    """Yield the given workspace, or a fresh one that is cleaned up afterwards."""
+    if workspace is not None:
+        yield workspace
+        return
+
+    with Workspace() as new_workspace:
+        yield new_workspace
+
+# =============================================================================
+# SHARED FILE LOCKING
+# =============================================================================
+
+@contextmanager
+def locked_file(path):
+    """
+    Hold an exclusive lock for a shared file across threads and, where fcntl
+    is available, across processes (e.g. several Gunicorn workers).
+    """
+    with _thread_locks_guard:
+        thread_lock = _thread_locks.setdefault(os.path.abspath(path), threading.Lock())
+
+    with thread_lock:
+        if fcntl is None:
+            yield
+            return
+
+        with open(path + ".lock", "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)